@@ -1,2 +1,10 @@
 # Empty init file to make modules directory a Python package
-from .bathymetry import *
\ No newline at end of file
+from .bathymetry import *
+from .stations import *
+from .regrid import *
+from .async_access import *
+from .data_cache import *
+from .shared_grid import *
+from .hypsometry import *
+from .sill import *
+from .plotting import *
\ No newline at end of file
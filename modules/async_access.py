@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import numpy as np
+import netCDF4 as nc
+import xarray as xr
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .bathymetry import _as_array, _coordinates, _sample_nearest, get_subset_index_ranges
+
+__all__ = ['AsyncBathymetry']
+
+# netCDF-C/HDF5 are not thread-safe, so all netCDF calls within one process go
+# through this lock. Worker processes each have their own lock and datasets and
+# therefore read in parallel.
+_netcdf_lock = threading.Lock()
+_open_datasets = {}
+
+
+def _open_dataset(path):
+    """Open a dataset once per process and keep its coordinates in memory (call with the lock held)."""
+    if path not in _open_datasets:
+        dataset = nc.Dataset(path, 'r')
+        _open_datasets[path] = (dataset, *_coordinates(dataset))
+    return _open_datasets[path]
+
+def _close_dataset(path):
+    with _netcdf_lock:
+        entry = _open_datasets.pop(path, None)
+        if entry is not None:
+            entry[0].close()
+
+def _read_subset(path, lon_min, lon_max, lat_min, lat_max):
+    """Worker: read the lon, lat and z arrays of a lon/lat box."""
+    with _netcdf_lock:
+        dataset, lon, lat = _open_dataset(path)
+        lat_indices, lon_indices = get_subset_index_ranges(lon, lat, lon_min, lon_max, lat_min, lat_max)
+        z = _as_array(dataset.variables['z'][lat_indices, lon_indices])
+    return lon[lon_indices], lat[lat_indices], z
+
+def _read_depths(path, lats, lons):
+    """Worker: read the depth of the nearest grid cell for a batch of points (NaN outside the grid)."""
+    with _netcdf_lock:
+        dataset, _, _ = _open_dataset(path)
+        return _sample_nearest(dataset, lats, lons)
+
+
+class AsyncBathymetry:
+    """asyncio interface for concurrent subset and depth requests on one bathymetry file.
+
+    Blocking netCDF reads run in a bounded thread or process pool so the event
+    loop stays responsive. Identical subset requests that are in flight at the
+    same time share one read (single-flight), and depth requests arriving within
+    `batch_window` seconds are answered by one batched read.
+
+    With executor='thread' the reads of one process are serialized (netCDF is
+    not thread-safe) but everything else runs concurrently; use
+    executor='process' for parallel reads.
+
+    Example:
+        async with AsyncBathymetry('data/bathymetry_subset.nc') as bathymetry:
+            subset, depth = await asyncio.gather(
+                bathymetry.subset(-30, -25, 64, 66),
+                bathymetry.depth(66.0128, -27.2702),
+            )
+    """
+
+    def __init__(self, path, max_workers=4, executor='thread', batch_window=0.005, max_batch=4096):
+        if executor == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        elif executor == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            raise ValueError("executor must be 'thread' or 'process'")
+        self.path = str(path)
+        self.executor_type = executor
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.stats = {'subset_requests': 0, 'subset_reads': 0, 'point_requests': 0, 'point_batches': 0}
+
+        self._in_flight = {}
+        self._pending_points = []
+        self._flush_handle = None
+        self._batch_tasks = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Answer outstanding requests, then shut down the worker pool."""
+        self._flush_points()
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+        self._executor.shutdown(wait=True)
+        if self.executor_type == 'thread':
+            _close_dataset(self.path)
+
+    async def subset(self, lon_min, lon_max, lat_min, lat_max):
+        """Bathymetry of a lon/lat box as an xarray Dataset (like `get_bathymetry_subset_data`).
+
+        Concurrent calls for the same box share one read and receive the same
+        Dataset, which should therefore not be modified in place.
+        """
+        self.stats['subset_requests'] += 1
+        key = (float(lon_min), float(lon_max), float(lat_min), float(lat_max))
+        task = self._in_flight.get(key)
+        if task is None:
+            self.stats['subset_reads'] += 1
+            task = asyncio.get_running_loop().create_task(self._load_subset(key))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shield the shared read so that one cancelled caller doesn't cancel it for everybody
+        return await asyncio.shield(task)
+
+    async def _load_subset(self, key):
+        loop = asyncio.get_running_loop()
+        lon, lat, z = await loop.run_in_executor(self._executor, _read_subset, self.path, *key)
+        return xr.Dataset({'z': (('lat', 'lon'), z)}, coords={'lat': lat, 'lon': lon})
+
+    async def depth(self, lat, lon):
+        """Depth (m) at the nearest grid point (NaN outside the grid), batched with other requests
+        arriving at the same time."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.stats['point_requests'] += 1
+        self._pending_points.append((lat, lon, future))
+
+        if len(self._pending_points) >= self.max_batch:
+            self._flush_points()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush_points)
+        return await future
+
+    async def depths(self, lats, lons):
+        """Depths (m) at many points at once, as a NumPy array (NaN outside the grid)."""
+        loop = asyncio.get_running_loop()
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        return await loop.run_in_executor(self._executor, _read_depths, self.path, lats, lons)
+
+    def _flush_points(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending_points = self._pending_points, []
+        if not batch:
+            return
+
+        self.stats['point_batches'] += 1
+        task = asyncio.get_running_loop().create_task(self._answer_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _answer_batch(self, batch):
+        lats = np.array([lat for lat, _, _ in batch], dtype=np.float64)
+        lons = np.array([lon for _, lon, _ in batch], dtype=np.float64)
+        try:
+            depths = await self.depths(lats, lons)
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, _, future), depth in zip(batch, depths):
+            if not future.done():
+                future.set_result(float(depth))
@@ -5,6 +5,9 @@ import netCDF4 as nc
 
 from tqdm import tqdm
 
+BATHYMETRY_DATA_URL = 'https://www.ngdc.noaa.gov/thredds/fileServer/global/ETOPO2022/60s/60s_bed_elev_netcdf/ETOPO_2022_v1_60s_N90W180_bed.nc'
+BATHYMETRY_DATA_PATH = 'data/ETOPO_2022_v1_60s_N90W180_bed.nc'
+
 class BathymetryDataSingleton:
     _instance = None
     _bathymetry_data = None
@@ -20,13 +23,17 @@ class BathymetryDataSingleton:
     def get(self):
         return self._bathymetry_data
     
-def download_large_file(url, local_path):
+def download_large_file(url, local_path, headers=None):
     chunk_size = 1024  # Size of each chunk in bytes
-    response = requests.get(url, stream=True)
+    response = requests.get(url, stream=True, headers=headers)
     
     # Raise an exception if the request was unsuccessful
     response.raise_for_status()
 
+    # Nothing to download if a conditional request found the file unchanged
+    if response.status_code == 304:
+        return response
+
     total_size = int(response.headers.get('Content-Length', 0))
     progress_bar = tqdm(total=total_size, unit='B', unit_scale=True)
 
@@ -37,6 +44,7 @@ def download_large_file(url, local_path):
 
     progress_bar.close()
     print("Download complete!")
+    return response
 
 def get_bathymetry_subset_from_url(local_path='data/bathymetry_subset.nc'):
     """Download bathymetry subset data from course website if not available locally."""
@@ -63,11 +71,18 @@ def get_bathymetry_subset_from_url(local_path='data/bathymetry_subset.nc'):
 
     return local_path
 
-def get_bathymetry_data():
-    """Loads bathymetry data from file or if not existent from URL"""
+def get_bathymetry_data(refresh=False):
+    """Loads bathymetry data from file or if not existent from URL
+
+    With refresh=True the local file is revalidated against the server
+    (ETag/Last-Modified) and, if a new release was downloaded, the derived
+    files recorded in data/manifest.json are rebuilt (see modules/data_cache.py).
+    """
+    # Imported here because data_cache itself builds on this module
+    from .data_cache import DataCache
 
-    bathymetry_data_url = 'https://www.ngdc.noaa.gov/thredds/fileServer/global/ETOPO2022/60s/60s_bed_elev_netcdf/ETOPO_2022_v1_60s_N90W180_bed.nc'
-    bathymetry_data_path = 'data/ETOPO_2022_v1_60s_N90W180_bed.nc'
+    bathymetry_data_url = BATHYMETRY_DATA_URL
+    bathymetry_data_path = BATHYMETRY_DATA_PATH
 
     if not os.path.exists('data'):
         os.makedirs('data')
@@ -75,33 +90,50 @@ def get_bathymetry_data():
     # Check if the bathymetry data file already exists locally
     if not os.path.isfile(bathymetry_data_path):
         print("Bathymetry data file is missing. Downloading ...")
-        download_large_file(bathymetry_data_url, bathymetry_data_path)
+        DataCache().fetch(bathymetry_data_url, bathymetry_data_path)
         print("OK, Downloaded.")
+    elif refresh:
+        cache = DataCache()
+        if cache.fetch(bathymetry_data_url, bathymetry_data_path):
+            print("Bathymetry data file was updated. Rebuilding derived files ...")
+        cache.rebuild_stale()
 
     # Load bathymetry data from file
     bathymetry_data = nc.Dataset(bathymetry_data_path, 'r')
 
     return bathymetry_data
 
+def get_subset_index_ranges(lon, lat, lon_min, lon_max, lat_min, lat_max):
+    """Index ranges (lat slice, lon slice) of the grid cells inside a lon/lat box.
+
+    The coordinates are monotonic, so the cells inside the box form one
+    contiguous block that can be read with a single hyperslab.
+    """
+    def index_range(axis, lo, hi):
+        inside = np.flatnonzero(np.logical_and(axis >= lo, axis <= hi))
+        if inside.size == 0:
+            return slice(0, 0)
+        return slice(int(inside[0]), int(inside[-1]) + 1)
+
+    return index_range(np.asarray(lat), lat_min, lat_max), index_range(np.asarray(lon), lon_min, lon_max)
+
 def get_bathymetry_subset_data(dataset, lon_min, lon_max, lat_min, lat_max):
-    # Extract longitude, latitude, and depth data
+    # Extract longitude and latitude data
     lon = dataset.variables['lon'][:]
     lat = dataset.variables['lat'][:]
-    depth = dataset.variables['z'][:]
 
     # Find the indices corresponding to the specified region
-    lon_indices = np.logical_and(lon >= lon_min, lon <= lon_max)
-    lat_indices = np.logical_and(lat >= lat_min, lat <= lat_max)
+    lat_indices, lon_indices = get_subset_index_ranges(lon, lat, lon_min, lon_max, lat_min, lat_max)
 
-    # Subset the data based on the specified region
-    subset_depth = depth[lat_indices][:, lon_indices]
+    # Read only the depth data of the specified region
+    subset_depth = dataset.variables['z'][lat_indices, lon_indices]
 
     # Create an in-memory netCDF4 dataset
     output_dataset = nc.Dataset('subset_dataset', 'w', memory=True)
 
     # Define dimensions
-    output_dataset.createDimension('lon', lon_indices.sum())
-    output_dataset.createDimension('lat', lat_indices.sum())
+    output_dataset.createDimension('lon', lon_indices.stop - lon_indices.start)
+    output_dataset.createDimension('lat', lat_indices.stop - lat_indices.start)
 
     # Create longitude and latitude variables
     output_lon = output_dataset.createVariable('lon', 'f4', ('lon',))
@@ -121,4 +153,103 @@ def get_bathymetry_subset_data(dataset, lon_min, lon_max, lat_min, lat_max):
     # Set data for depth variable
     output_depth[:, :] = subset_depth
 
-    return output_dataset
\ No newline at end of file
+    return output_dataset
+
+def _as_array(values):
+    """Convert a netCDF4/xarray variable slice to a float NumPy array with NaN for missing values."""
+    return np.ma.filled(np.ma.asarray(values).astype(np.float64), np.nan)
+
+def _coordinates(dataset):
+    """Return the lon and lat coordinate vectors of a netCDF4 or xarray dataset."""
+    lon = _as_array(dataset.variables['lon'][:])
+    lat = _as_array(dataset.variables['lat'][:])
+    return lon, lat
+
+def _nearest_indices(axis, values):
+    """Index of the nearest grid coordinate for each value on a monotonic axis.
+
+    Values outside the axis are clamped to the first/last index, which matches
+    xarray's `.sel(method='nearest')`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    descending = axis[0] > axis[-1]
+    if descending:
+        axis = axis[::-1]
+
+    right = np.clip(np.searchsorted(axis, values), 1, len(axis) - 1)
+    left = right - 1
+    indices = np.where(values - axis[left] <= axis[right] - values, left, right)
+
+    if descending:
+        indices = len(axis) - 1 - indices
+    return indices
+
+def _read_points(dataset, rows, cols, max_slab_cells=4_000_000):
+    """Read z at many (row, col) grid indices with as few netCDF reads as possible.
+
+    If the bounding box of all points is small it is read in one slab, otherwise
+    one hyperslab is read per distinct row, spanning only the needed columns.
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    z = dataset.variables['z']
+    depths = np.full(rows.shape, np.nan)
+    if rows.size == 0:
+        return depths
+
+    row_min, row_max = rows.min(), rows.max()
+    col_min, col_max = cols.min(), cols.max()
+    if (row_max - row_min + 1) * (col_max - col_min + 1) <= max_slab_cells:
+        slab = _as_array(z[row_min:row_max + 1, col_min:col_max + 1])
+        return slab[rows - row_min, cols - col_min]
+
+    # Group points by row so that each row is read once
+    order = np.argsort(rows, kind='stable')
+    unique_rows, starts = np.unique(rows[order], return_index=True)
+    for row, group in zip(unique_rows, np.split(order, starts[1:])):
+        group_cols = cols[group]
+        lo, hi = group_cols.min(), group_cols.max()
+        segment = _as_array(z[row, lo:hi + 1])
+        depths[group] = segment[group_cols - lo]
+    return depths
+
+def _sample_nearest(dataset, lat, lon, clamp=False):
+    """Depth of the nearest grid cell for many points, NaN outside the grid unless `clamp`."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    grid_lon, grid_lat = _coordinates(dataset)
+    rows = _nearest_indices(grid_lat, lat)
+    cols = _nearest_indices(grid_lon, lon)
+
+    if clamp:
+        inside = np.ones(lat.shape, dtype=bool)
+    else:
+        # Half a grid cell of tolerance around the edges of the grid
+        half_dlat = abs(grid_lat[-1] - grid_lat[0]) / max(len(grid_lat) - 1, 1) / 2
+        half_dlon = abs(grid_lon[-1] - grid_lon[0]) / max(len(grid_lon) - 1, 1) / 2
+        inside = ((lat >= grid_lat.min() - half_dlat) & (lat <= grid_lat.max() + half_dlat) &
+                  (lon >= grid_lon.min() - half_dlon) & (lon <= grid_lon.max() + half_dlon))
+
+    depths = np.full(lat.shape, np.nan)
+    depths[inside] = _read_points(dataset, rows[inside], cols[inside])
+    return depths
+
+def _cell_edges(centres):
+    """Cell edges of a 1D grid from its cell centres (midpoints, extrapolated at both ends)."""
+    centres = np.asarray(centres, dtype=np.float64)
+    if len(centres) == 1:
+        return np.array([centres[0] - 0.5, centres[0] + 0.5])
+    midpoints = (centres[1:] + centres[:-1]) / 2
+    return np.concatenate([[2 * centres[0] - midpoints[0]], midpoints, [2 * centres[-1] - midpoints[-1]]])
+
+def _fingerprint(*arrays):
+    """Hash of the shapes and float64 values of arrays, e.g. grid coordinates used as cache keys."""
+    # Imported here, as this module has no __all__ and would export it through `from modules import *`
+    import hashlib
+
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
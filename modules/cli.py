@@ -0,0 +1,256 @@
+"""
+Command-line batch extraction of bathymetry regions and point depths.
+
+    python -m modules.cli boxes.csv -o output/
+    python -m modules.cli stations.csv --data data/bathymetry_subset.nc -o output/
+    python -m modules.cli boxes.csv --dry-run
+
+The input is a CSV file with a header row. Files with lon_min, lon_max,
+lat_min and lat_max columns list boxes; each box is written to
+<output>/<name>.nc (or .csv with --format csv). Files with lat and lon columns
+list points; their depths (nearest grid cell, NaN outside the grid) are
+written to <output>/<input>_depths.csv. An optional name column names the
+boxes and points.
+
+The work is spread over a process pool in which every worker opens the
+dataset once. --dry-run only reads the coordinates and prints how many bytes
+of z each box would read; it never downloads the ETOPO file, but uses its
+known grid if the file is missing.
+"""
+
+import os
+import re
+import csv
+import sys
+import time
+import argparse
+import numpy as np
+import netCDF4 as nc
+
+from multiprocessing import Pool
+from tqdm import tqdm
+
+from .bathymetry import (BATHYMETRY_DATA_PATH, BathymetryDataSingleton, _coordinates, _sample_nearest,
+                         get_bathymetry_data, get_bathymetry_subset_data, get_subset_index_ranges)
+
+BOX_COLUMNS = ('lon_min', 'lon_max', 'lat_min', 'lat_max')
+POINT_COLUMNS = ('lat', 'lon')
+
+
+def read_requests(path):
+    """Read a CSV file of boxes or points.
+
+    Returns:
+    - ('boxes', [(name, lon_min, lon_max, lat_min, lat_max), ...]) or
+      ('points', [(name, lat, lon), ...])
+    """
+    with open(path, newline='') as file:
+        reader = csv.DictReader(file)
+        columns = set(reader.fieldnames or [])
+        if columns.issuperset(BOX_COLUMNS):
+            kind, keys = 'boxes', BOX_COLUMNS
+        elif columns.issuperset(POINT_COLUMNS):
+            kind, keys = 'points', POINT_COLUMNS
+        else:
+            raise ValueError(f"{path} needs the columns {', '.join(BOX_COLUMNS)} (boxes) "
+                             f"or {', '.join(POINT_COLUMNS)} (points)")
+
+        prefix = 'box' if kind == 'boxes' else 'point'
+        requests = []
+        for number, row in enumerate(reader):
+            name = (row.get('name') or '').strip() or f'{prefix}{number:04d}'
+            try:
+                requests.append((name, *(float(row[key]) for key in keys)))
+            except (TypeError, ValueError):
+                raise ValueError(f"{path}, line {reader.line_num}: invalid number in {row}") from None
+
+    if kind == 'boxes':
+        # Every box gets its own output file, so the names must not collide after
+        # sanitizing (compared case-insensitively for macOS and Windows)
+        seen = {}
+        for name, *_ in requests:
+            seen.setdefault(_file_name(name).lower(), []).append(name)
+        duplicates = [names for names in seen.values() if len(names) > 1]
+        if duplicates:
+            raise ValueError(f"{path}: box names map to the same output file: "
+                             + '; '.join(', '.join(repr(name) for name in names) for names in duplicates))
+    return kind, requests
+
+def _file_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name)
+
+def etopo_60s_coordinates():
+    """Cell centres of the ETOPO 2022 60 arc-second grid (BATHYMETRY_DATA_URL), without downloading it."""
+    lon = -180 + (np.arange(21600) + 0.5) / 60
+    lat = -90 + (np.arange(10800) + 0.5) / 60
+    return lon, lat
+
+def estimate_box_bytes(dataset, boxes):
+    """Cells and bytes of z read for each box, from the index ranges of the grid.
+
+    `dataset` may also be None for the (not yet downloaded) ETOPO 60s file,
+    whose z is stored as float32.
+
+    Returns:
+    - List of (name, number of lat rows, number of lon columns, bytes)
+    """
+    if dataset is None:
+        (lon, lat), itemsize = etopo_60s_coordinates(), 4
+    else:
+        lon, lat = _coordinates(dataset)
+        itemsize = dataset.variables['z'].dtype.itemsize
+    estimates = []
+    for name, lon_min, lon_max, lat_min, lat_max in boxes:
+        lat_indices, lon_indices = get_subset_index_ranges(lon, lat, lon_min, lon_max, lat_min, lat_max)
+        rows, cols = lat_indices.stop - lat_indices.start, lon_indices.stop - lon_indices.start
+        estimates.append((name, rows, cols, rows * cols * itemsize))
+    return estimates
+
+def _open_worker_dataset(path):
+    """Pool initializer: open the dataset once per worker."""
+    BathymetryDataSingleton().set(nc.Dataset(path, 'r'))
+
+def _extract_box(task):
+    name, lon_min, lon_max, lat_min, lat_max, output_dir, output_format = task
+    started = time.perf_counter()
+    dataset = BathymetryDataSingleton().get()
+    subset = get_bathymetry_subset_data(dataset, lon_min, lon_max, lat_min, lat_max)
+    shape = subset.variables['z'].shape
+    bytes_read = int(np.prod(shape)) * dataset.variables['z'].dtype.itemsize
+
+    if output_format == 'csv':
+        path = os.path.join(output_dir, _file_name(name) + '.csv')
+        lon2d, lat2d = np.meshgrid(subset.variables['lon'][:], subset.variables['lat'][:])
+        z = np.ma.filled(subset.variables['z'][:].astype(np.float64), np.nan)
+        np.savetxt(path, np.column_stack([lon2d.ravel(), lat2d.ravel(), z.ravel()]),
+                   fmt=['%.6f', '%.6f', '%.2f'], delimiter=',', header='lon,lat,z', comments='')
+        subset.close()
+    else:
+        path = os.path.join(output_dir, _file_name(name) + '.nc')
+        with open(path, 'wb') as file:
+            file.write(subset.close())
+    return {'name': name, 'path': path, 'cells': int(np.prod(shape)), 'bytes': bytes_read,
+            'seconds': time.perf_counter() - started}
+
+def _sample_chunk(task):
+    start, lat, lon = task
+    return start, _sample_nearest(BathymetryDataSingleton().get(), lat, lon)
+
+def _run_tasks(function, tasks, data_path, workers, progress):
+    """Run tasks on a pool whose workers each open the dataset once (in this process if workers == 1)."""
+    if workers == 1:
+        singleton = BathymetryDataSingleton()
+        previous = singleton.get()
+        _open_worker_dataset(data_path)
+        try:
+            yield from (function(task) for task in tqdm(tasks, disable=not progress))
+        finally:
+            singleton.get().close()
+            singleton.set(previous)
+        return
+
+    with Pool(workers, initializer=_open_worker_dataset, initargs=(data_path,)) as pool:
+        yield from tqdm(pool.imap_unordered(function, tasks), total=len(tasks), disable=not progress)
+
+def extract_boxes(boxes, data_path, output_dir, output_format='netcdf', workers=None, progress=True):
+    """Extract every box to a file in parallel.
+
+    Returns:
+    - Summary dict with 'count', 'cells', 'bytes', 'seconds' and the per-box 'results'
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(*box, output_dir, output_format) for box in boxes]
+    started = time.perf_counter()
+    results = list(_run_tasks(_extract_box, tasks, data_path, workers or os.cpu_count(), progress))
+    return {'count': len(results), 'cells': sum(result['cells'] for result in results),
+            'bytes': sum(result['bytes'] for result in results),
+            'seconds': time.perf_counter() - started, 'results': results}
+
+def sample_points(points, data_path, output_path, workers=None, chunk_size=10000, progress=True):
+    """Look up the depth of every point in parallel and write name, lat, lon, depth to a CSV file.
+
+    Returns:
+    - Summary dict with 'count', 'seconds' and the 'depths'
+    """
+    names = [point[0] for point in points]
+    lat = np.array([point[1] for point in points], dtype=np.float64)
+    lon = np.array([point[2] for point in points], dtype=np.float64)
+    tasks = [(start, lat[start:start + chunk_size], lon[start:start + chunk_size])
+             for start in range(0, len(points), chunk_size)]
+
+    started = time.perf_counter()
+    depths = np.full(len(points), np.nan)
+    for start, chunk in _run_tasks(_sample_chunk, tasks, data_path, workers or os.cpu_count(), progress):
+        depths[start:start + len(chunk)] = chunk
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['name', 'lat', 'lon', 'depth'])
+        for row in zip(names, lat, lon, depths):
+            writer.writerow([row[0], f'{row[1]:.6f}', f'{row[2]:.6f}', '' if np.isnan(row[3]) else f'{row[3]:.2f}'])
+    return {'count': len(points), 'seconds': time.perf_counter() - started, 'depths': depths}
+
+def _megabytes(value):
+    return value / 2**20
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract bathymetry boxes or point depths in parallel.")
+    parser.add_argument('input', help="CSV file of boxes (name,lon_min,lon_max,lat_min,lat_max) or points (name,lat,lon)")
+    parser.add_argument('-o', '--output', default='output', help="Output directory (default: output)")
+    parser.add_argument('--data', default=BATHYMETRY_DATA_PATH, help=f"Bathymetry netCDF file (default: {BATHYMETRY_DATA_PATH})")
+    parser.add_argument('--format', choices=['netcdf', 'csv'], default='netcdf', help="Output format of boxes")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="Points per task")
+    parser.add_argument('--dry-run', action='store_true', help="Only print the bytes each box would read")
+    parser.add_argument('-q', '--quiet', action='store_true', help="No progress bar")
+    args = parser.parse_args(argv)
+
+    try:
+        kind, requests = read_requests(args.input)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    data_exists = os.path.isfile(args.data)
+    if not data_exists and args.data != BATHYMETRY_DATA_PATH:
+        parser.error(f"{args.data} does not exist")
+
+    if args.dry_run:
+        if kind == 'points':
+            print(f"{len(requests)} points in {-(-len(requests) // args.chunk_size)} tasks")
+            return {'count': len(requests)}
+        if data_exists:
+            with nc.Dataset(args.data, 'r') as dataset:
+                estimates = estimate_box_bytes(dataset, requests)
+        else:
+            # A dry run never downloads; the ETOPO grid is known
+            print(f"{args.data} is not downloaded yet; estimating from the ETOPO 2022 60s grid")
+            estimates = estimate_box_bytes(None, requests)
+        for name, rows, cols, size in estimates:
+            print(f"{name:<24} {rows:>6} x {cols:<6} {_megabytes(size):>10.2f} MB")
+        total = sum(size for *_, size in estimates)
+        print(f"{len(estimates)} boxes, {_megabytes(total):.2f} MB in total")
+        return {'count': len(estimates), 'bytes': total, 'estimates': estimates}
+
+    if not data_exists:
+        get_bathymetry_data().close()
+
+    if kind == 'boxes':
+        summary = extract_boxes(requests, args.data, args.output, args.format, args.workers, not args.quiet)
+        seconds = max(summary['seconds'], 1e-9)
+        print(f"Extracted {summary['count']} boxes ({summary['cells']:,} cells, {_megabytes(summary['bytes']):.1f} MB) "
+              f"in {seconds:.2f} s with {args.workers} workers: {summary['count'] / seconds:.1f} boxes/s, "
+              f"{_megabytes(summary['bytes']) / seconds:.1f} MB/s")
+    else:
+        output_path = os.path.join(args.output, os.path.splitext(os.path.basename(args.input))[0] + '_depths.csv')
+        summary = sample_points(requests, args.data, output_path, args.workers, args.chunk_size, not args.quiet)
+        seconds = max(summary['seconds'], 1e-9)
+        print(f"Sampled {summary['count']:,} points in {seconds:.2f} s with {args.workers} workers: "
+              f"{summary['count'] / seconds:,.0f} points/s -> {output_path}")
+    return summary
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
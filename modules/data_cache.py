@@ -0,0 +1,241 @@
+import os
+import json
+import hashlib
+import datetime
+import email.utils
+import netCDF4 as nc
+
+from .bathymetry import download_large_file, get_bathymetry_subset_data
+
+__all__ = ['MANIFEST_PATH', 'register_builder', 'file_sha256', 'build_bathymetry_subset', 'DataCache']
+
+MANIFEST_PATH = 'data/manifest.json'
+
+# Functions that build derived files, by name, so that the manifest can refer to them
+_builders = {}
+
+
+def register_builder(name):
+    """Decorator registering a function that builds a derived file from its sources.
+
+    The function is called as `builder(sources, output, **params)` and must write
+    `output`. Register builders before calling `DataCache.refresh()`, so that stale
+    files can be rebuilt.
+    """
+    def decorator(func):
+        _builders[name] = func
+        return func
+    return decorator
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+@register_builder('bathymetry_subset')
+def build_bathymetry_subset(sources, output, lon_min, lon_max, lat_min, lat_max):
+    """Write the subset of a bathymetry file inside a lon/lat box to a netCDF file."""
+    with nc.Dataset(sources[0], 'r') as dataset:
+        subset = get_bathymetry_subset_data(dataset, lon_min, lon_max, lat_min, lat_max)
+        contents = subset.close()
+    with open(output, 'wb') as file:
+        file.write(contents)
+
+
+class DataCache:
+    """Track downloaded source files and the files derived from them.
+
+    The manifest (JSON, data/manifest.json by default) records for every source
+    its URL, ETag, Last-Modified and SHA-256, and for every derived file the
+    builder, parameters and the hashes of the sources it was built from.
+    `refresh()` then only downloads sources that changed on the server and only
+    rebuilds derived files (including derived-of-derived) whose inputs changed.
+
+    Example:
+        cache = DataCache()
+        cache.fetch(BATHYMETRY_DATA_URL, BATHYMETRY_DATA_PATH)
+        cache.build('data/denmark_strait.nc', 'bathymetry_subset', [BATHYMETRY_DATA_PATH],
+                    lon_min=-35, lon_max=-25, lat_min=63, lat_max=66)
+        cache.refresh()
+    """
+
+    def __init__(self, manifest_path=MANIFEST_PATH):
+        self.manifest_path = os.fspath(manifest_path)
+        self.manifest = {'sources': {}, 'derived': {}}
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path) as file:
+                self.manifest.update(json.load(file))
+
+    @property
+    def sources(self):
+        return self.manifest['sources']
+
+    @property
+    def derived(self):
+        return self.manifest['derived']
+
+    def save(self):
+        """Write the manifest atomically."""
+        directory = os.path.dirname(self.manifest_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temporary_path = self.manifest_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.manifest, file, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.manifest_path)
+
+    def fetch(self, url, local_path):
+        """Download a source file unless the server reports it unchanged.
+
+        Sends If-None-Match/If-Modified-Since from the previous download, or for
+        a local file without a manifest record (downloaded before the manifest
+        existed) If-Modified-Since from its modification time. A new download
+        only replaces the local file if its content hash differs.
+
+        Returns:
+        - True if the local file changed, False otherwise
+        """
+        local_path = os.fspath(local_path)
+        record = self.sources.get(local_path, {})
+        headers = {}
+        if os.path.isfile(local_path) and record.get('url') == url:
+            if record.get('etag'):
+                headers['If-None-Match'] = record['etag']
+            if record.get('last_modified'):
+                headers['If-Modified-Since'] = record['last_modified']
+        if os.path.isfile(local_path) and not headers:
+            headers['If-Modified-Since'] = email.utils.formatdate(os.path.getmtime(local_path), usegmt=True)
+
+        partial_path = local_path + '.part'
+        response = download_large_file(url, partial_path, headers=headers)
+        if response.status_code == 304:
+            if record.get('url') != url:
+                # Start tracking the local file, hashing it instead of downloading it
+                record = self.sources[local_path] = {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified') or headers['If-Modified-Since'],
+                    'sha256': file_sha256(local_path),
+                    'size': os.path.getsize(local_path),
+                }
+            record['checked'] = _now()
+            self.save()
+            return False
+
+        sha256 = file_sha256(partial_path)
+        previous_sha256 = record.get('sha256')
+        if previous_sha256 is None and os.path.isfile(local_path):
+            previous_sha256 = file_sha256(local_path)
+        changed = sha256 != previous_sha256
+        if changed:
+            os.replace(partial_path, local_path)
+        else:
+            os.remove(partial_path)
+
+        self.sources[local_path] = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': sha256,
+            'size': os.path.getsize(local_path),
+            'checked': _now(),
+        }
+        self.save()
+        return changed
+
+    def track(self, path):
+        """Record a local (not downloaded) file as a source, e.g. data/bathymetry_subset.nc."""
+        path = os.fspath(path)
+        self.sources[path] = {'sha256': file_sha256(path), 'size': os.path.getsize(path), 'checked': _now()}
+        self.save()
+
+    def _current_hash(self, path):
+        record = self.sources.get(path) or self.derived.get(path)
+        if record is None:
+            self.track(path)
+            record = self.sources[path]
+        return record['sha256']
+
+    def build(self, output, builder, sources, **params):
+        """Build a derived file with a registered builder and record its lineage."""
+        if builder not in _builders:
+            raise ValueError(f"Unknown builder '{builder}', register it with @register_builder")
+        output = os.fspath(output)
+        sources = [os.fspath(source) for source in sources]
+
+        _builders[builder](sources, output, **params)
+        self.derived[output] = {
+            'builder': builder,
+            'sources': sources,
+            'params': params,
+            'source_hashes': {source: self._current_hash(source) for source in sources},
+            'sha256': file_sha256(output),
+            'built': _now(),
+        }
+        self.save()
+        return output
+
+    def _build_order(self):
+        """Derived files ordered so that every file comes after the derived files it is built from."""
+        order, visiting = [], set()
+
+        def visit(output):
+            if output in order or output in visiting:
+                return
+            visiting.add(output)
+            for source in self.derived[output]['sources']:
+                if source in self.derived:
+                    visit(source)
+            visiting.discard(output)
+            order.append(output)
+
+        for output in self.derived:
+            visit(output)
+        return order
+
+    def _is_stale(self, output):
+        record = self.derived[output]
+        return not os.path.isfile(output) or any(
+            record['source_hashes'].get(source) != self._current_hash(source) for source in record['sources'])
+
+    def stale(self):
+        """Derived files that are out of date, directly or through another stale derived file."""
+        stale = []
+        for output in self._build_order():
+            sources = self.derived[output]['sources']
+            if self._is_stale(output) or any(source in stale for source in sources):
+                stale.append(output)
+        return stale
+
+    def rebuild_stale(self):
+        """Rebuild derived files whose sources changed, in dependency order. Returns the rebuilt paths."""
+        rebuilt = []
+        for output in self._build_order():
+            if self._is_stale(output):
+                record = self.derived[output]
+                self.build(output, record['builder'], record['sources'], **record['params'])
+                rebuilt.append(output)
+        return rebuilt
+
+    def refresh(self):
+        """Revalidate all sources and rebuild only the derived files that depend on changed ones.
+
+        Returns:
+        - dict with the lists of 'updated_sources' and 'rebuilt' derived files
+        """
+        updated = []
+        for path, record in list(self.sources.items()):
+            if record.get('url'):
+                if self.fetch(record['url'], path):
+                    updated.append(path)
+            elif os.path.isfile(path) and file_sha256(path) != record['sha256']:
+                self.track(path)
+                updated.append(path)
+        return {'updated_sources': updated, 'rebuilt': self.rebuild_stale()}
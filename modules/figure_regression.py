@@ -0,0 +1,342 @@
+"""
+Golden-image regression tests for the three exercise figures.
+
+The maps of the exercise are rendered from the bathymetry subset with the
+reference settings and compared with stored PNGs in tests/baseline/ by a
+perceptual hash (difference hash of a small thumbnail) and by SSIM of the
+downsampled colour channels, both computed with NumPy. Every figure is
+rendered and compared in its own process.
+
+    python -m modules.figure_regression            # compare
+    python -m modules.figure_regression --update   # rewrite the references
+
+The figures are rendered by `render_figure1/2/3` below, which are copies of
+the reference solutions of the notebook cells, not by the notebook itself:
+the checks catch changes in the data, the libraries and these renderers, but
+a change to a figure cell of src/assignment.ipynb has to be copied here by
+hand. Coastlines need Natural Earth downloads and are left out, so the
+figures only depend on the fixture data.
+
+Rendered pixels depend on the matplotlib, cartopy and FreeType versions, so
+the versions used for the references are stored with them (versions.json)
+and `references_match_versions` tells whether a comparison is meaningful in
+the current environment.
+
+`check_figure` draws with the caller's matplotlib backend; the worker
+processes of `check_figures` and the command line use Agg. Not imported by
+`from modules import *`.
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import json
+import numpy as np
+import xarray as xr
+import cartopy
+import matplotlib
+import matplotlib.pyplot as plt
+import cartopy.crs as ccrs
+
+from matplotlib import ft2font
+
+from concurrent.futures import ProcessPoolExecutor
+
+DATA_PATH = 'data/bathymetry_subset.nc'
+REFERENCE_DIR = 'tests/baseline'
+VERSIONS_FILE = 'versions.json'
+FIGURE_DPI = 50
+
+# DS2 mooring, as in the notebook
+DS2_LAT, DS2_LON = 66.0128, -27.270200
+
+
+def _map_axes(figsize, lons, lats):
+    fig, ax = plt.subplots(figsize=figsize, subplot_kw={'projection': ccrs.Mercator()})
+    ax.set_extent([lons.min(), lons.max(), lats.min(), lats.max()], crs=ccrs.PlateCarree())
+    return fig, ax
+
+def render_figure1(dataset):
+    """Figure 1: matplotlib filled contour map."""
+    lats, lons, bathymetry = dataset.lat.values, dataset.lon.values, dataset.z.values
+    fig, ax = plt.subplots(figsize=(10, 8))
+    contour = ax.contourf(lons, lats, bathymetry, levels=np.arange(-4000, 1000, 500), cmap='viridis')
+    cbar = fig.colorbar(contour, ax=ax)
+    cbar.set_label('Depth (m)', fontsize=12)
+    ax.set_xlabel('Longitude', fontsize=12)
+    ax.set_ylabel('Latitude', fontsize=12)
+    ax.set_title('North Atlantic Bathymetry Map', fontsize=14)
+    ax.grid(True, alpha=0.3)
+    return fig
+
+def render_figure2(dataset, coastlines=False):
+    """Figure 2: cartopy map in Mercator projection."""
+    lats, lons, bathymetry = dataset.lat.values, dataset.lon.values, dataset.z.values
+    fig, ax = _map_axes((12, 10), lons, lats)
+    if coastlines:
+        ax.coastlines(resolution='50m', color='black', linewidth=0.8)
+    gl = ax.gridlines(draw_labels=True, alpha=0.5)
+    gl.right_labels = False
+
+    contour = ax.contourf(lons, lats, bathymetry, levels=np.arange(-4000, 1000, 500),
+                          cmap='Blues_r', transform=ccrs.PlateCarree())
+    cbar = fig.colorbar(contour, ax=ax, orientation='vertical', pad=0.05, aspect=20, shrink=0.5)
+    cbar.set_label('Depth (m)')
+    ax.set_title('North Atlantic Bathymetry (Mercator Projection)')
+    return fig
+
+def render_figure3(dataset, coastlines=False):
+    """Figure 3: 16 x 26 cm cartopy map with the DS2 mooring and the deepest point."""
+    lats, lons, bathymetry = dataset.lat.values, dataset.lon.values, dataset.z.values
+    fig, ax = _map_axes((16 / 2.54, 26 / 2.54), lons, lats)
+    if coastlines:
+        ax.coastlines(resolution='50m', color='black', linewidth=0.8)
+    gl = ax.gridlines(draw_labels=True, alpha=0.5)
+    gl.top_labels = False
+    gl.right_labels = False
+
+    contour = ax.contourf(lons, lats, bathymetry, levels=np.arange(-4000, 1000, 500),
+                          cmap='Blues_r', transform=ccrs.PlateCarree())
+    cbar = fig.colorbar(contour, ax=ax, orientation='horizontal', pad=0.05)
+    cbar.set_label('Depth (m)')
+
+    deepest_idx = np.unravel_index(np.nanargmin(bathymetry), bathymetry.shape)
+    ax.plot(DS2_LON, DS2_LAT, 'o', color='red', markersize=8, transform=ccrs.PlateCarree(), label='DS2 Mooring')
+    ax.plot(lons[deepest_idx[1]], lats[deepest_idx[0]], 'ks', markersize=8, transform=ccrs.PlateCarree(),
+            label=f'Deepest Point ({bathymetry[deepest_idx]:.0f} m)', markeredgecolor='white', markeredgewidth=1)
+    ax.legend(loc='lower right', frameon=True, fancybox=True, shadow=True)
+    fig.tight_layout()
+    return fig
+
+FIGURES = {
+    'ex2fig1': render_figure1,
+    'ex2fig2': render_figure2,
+    'ex2fig3': render_figure3,
+}
+
+def rendering_versions():
+    """Versions of the libraries that determine the rendered pixels."""
+    return {'matplotlib': matplotlib.__version__, 'cartopy': cartopy.__version__,
+            'freetype': ft2font.__freetype_version__}
+
+def reference_versions(reference_dir=REFERENCE_DIR):
+    """Library versions the references were rendered with, or None if not recorded."""
+    path = os.path.join(reference_dir, VERSIONS_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+def references_match_versions(reference_dir=REFERENCE_DIR):
+    """True if the references were rendered with the library versions installed here."""
+    return reference_versions(reference_dir) == rendering_versions()
+
+def render_png(name, dataset, dpi=FIGURE_DPI):
+    """Render one of FIGURES to PNG bytes, independent of the user's matplotlib settings."""
+    with plt.style.context('default'):
+        fig = FIGURES[name](dataset)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
+    return buffer.getvalue()
+
+def read_png(contents):
+    return plt.imread(io.BytesIO(contents), format='png')
+
+def _composite(image):
+    """Float RGB image in [0, 1], with transparent pixels composited onto white."""
+    image = np.asarray(image)
+    if image.dtype == np.uint8:
+        image = image / 255.0
+    image = image.astype(np.float64)
+    if image.ndim == 2:
+        return np.repeat(image[..., None], 3, axis=-1)
+    rgb = image[..., :3]
+    if image.shape[-1] == 4:
+        alpha = image[..., 3:]
+        rgb = rgb * alpha + (1 - alpha)
+    return rgb
+
+def _luminance(image):
+    """Greyscale float image in [0, 1]."""
+    return _composite(image) @ np.array([0.299, 0.587, 0.114])
+
+def _offsets(size_difference, max_offset):
+    size_difference = abs(size_difference)
+    return range(size_difference + 1) if size_difference <= max_offset else [size_difference // 2]
+
+def _common_crop(image, reference, max_offset=8):
+    """Crop two images of slightly different size to their common shape where they agree best."""
+    height = min(image.shape[0], reference.shape[0])
+    width = min(image.shape[1], reference.shape[1])
+    rows, cols = image.shape[0] - reference.shape[0], image.shape[1] - reference.shape[1]
+    gray, reference_gray = _luminance(image), _luminance(reference)
+
+    best = None
+    for row in _offsets(rows, max_offset):
+        for col in _offsets(cols, max_offset):
+            offset = (row if rows > 0 else 0, col if cols > 0 else 0)
+            reference_offset = (row if rows < 0 else 0, col if cols < 0 else 0)
+            error = np.mean(np.abs(gray[offset[0]:offset[0] + height, offset[1]:offset[1] + width] -
+                                   reference_gray[reference_offset[0]:reference_offset[0] + height,
+                                                  reference_offset[1]:reference_offset[1] + width]))
+            if best is None or error < best[0]:
+                best = (error, offset, reference_offset)
+
+    _, offset, reference_offset = best
+    return (image[offset[0]:offset[0] + height, offset[1]:offset[1] + width],
+            reference[reference_offset[0]:reference_offset[0] + height, reference_offset[1]:reference_offset[1] + width])
+
+def _block_mean(gray, shape):
+    """Resample a greyscale image to `shape` by averaging the pixels of (nearly) equal blocks."""
+    rows = np.linspace(0, gray.shape[0], shape[0] + 1).astype(int)
+    cols = np.linspace(0, gray.shape[1], shape[1] + 1).astype(int)
+    sums = np.add.reduceat(np.add.reduceat(gray, rows[:-1], axis=0), cols[:-1], axis=1)
+    return sums / np.outer(np.diff(rows), np.diff(cols))
+
+def perceptual_hash(image, size=16):
+    """Difference hash: signs of the horizontal gradients of a size x (size + 1) thumbnail."""
+    thumbnail = _block_mean(_luminance(image), (size, size + 1))
+    return thumbnail[:, 1:] > thumbnail[:, :-1]
+
+def hash_distance(hash1, hash2):
+    """Number of differing bits of two perceptual hashes."""
+    return int(np.count_nonzero(hash1 != hash2))
+
+def _box_mean(values, window):
+    """Mean over every window x window block (valid positions only), from an integral image."""
+    integral = np.pad(values.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    return (integral[window:, window:] - integral[:-window, window:]
+            - integral[window:, :-window] + integral[:-window, :-window]) / window ** 2
+
+def ssim(image1, image2, window=7):
+    """Mean structural similarity of two greyscale images of equal shape, with values in [0, 1]."""
+    x, y = np.asarray(image1, dtype=np.float64), np.asarray(image2, dtype=np.float64)
+    if x.shape != y.shape:
+        raise ValueError("Images must have the same shape")
+    c1, c2 = 0.01 ** 2, 0.03 ** 2
+    mean_x, mean_y = _box_mean(x, window), _box_mean(y, window)
+    var_x = _box_mean(x * x, window) - mean_x ** 2
+    var_y = _box_mean(y * y, window) - mean_y ** 2
+    covariance = _box_mean(x * y, window) - mean_x * mean_y
+    similarity = (((2 * mean_x * mean_y + c1) * (2 * covariance + c2)) /
+                  ((mean_x ** 2 + mean_y ** 2 + c1) * (var_x + var_y + c2)))
+    return float(similarity.mean())
+
+def compare_images(image, reference, downsample=2, min_ssim=0.97, max_hash_distance=12, max_size_change=0.03):
+    """Compare a rendered image with its reference.
+
+    Images whose size differs slightly (a changed tight bounding box) are
+    cropped to the offset where they agree best. SSIM is computed per colour
+    channel on images averaged down by `downsample`, which hides sub-pixel
+    differences in text rendering; the lowest of the three counts.
+
+    Returns:
+    - Dict with 'ssim', 'hash_distance', 'size_change' and 'passed'
+    """
+    rgb, reference_rgb = _composite(image), _composite(reference)
+    size_change = max(abs(a - b) / b for a, b in zip(rgb.shape[:2], reference_rgb.shape[:2]))
+    cropped, reference_cropped = _common_crop(rgb, reference_rgb)
+    shape = (cropped.shape[0] // downsample, cropped.shape[1] // downsample)
+
+    result = {
+        'ssim': min(ssim(_block_mean(cropped[..., channel], shape), _block_mean(reference_cropped[..., channel], shape))
+                    for channel in range(3)),
+        'hash_distance': hash_distance(perceptual_hash(rgb), perceptual_hash(reference_rgb)),
+        'size_change': size_change,
+    }
+    result['passed'] = (result['ssim'] >= min_ssim and result['hash_distance'] <= max_hash_distance
+                        and size_change <= max_size_change)
+    return result
+
+def _write_difference(path, image, reference):
+    """Side by side: rendered, reference and the amplified absolute difference."""
+    gray, reference_gray = _luminance(image), _luminance(reference)
+    height = max(gray.shape[0], reference_gray.shape[0])
+    width = max(gray.shape[1], reference_gray.shape[1])
+    padded = [np.pad(g, ((0, height - g.shape[0]), (0, width - g.shape[1])), constant_values=1)
+              for g in (gray, reference_gray)]
+    difference = 1 - np.clip(4 * np.abs(padded[0] - padded[1]), 0, 1)
+    plt.imsave(path, np.hstack([padded[0], padded[1], difference]), cmap='gray', vmin=0, vmax=1)
+
+def check_figure(name, data_path=DATA_PATH, reference_dir=REFERENCE_DIR, output_dir=None, update=False,
+                 dpi=FIGURE_DPI, **thresholds):
+    """Render one figure and compare it with (or, with update=True, store it as) its reference.
+
+    On failure the rendered image and a difference image are written to output_dir.
+    """
+    started = time.perf_counter()
+    with xr.open_dataset(data_path) as dataset:
+        contents = render_png(name, dataset.load(), dpi)
+    reference_path = os.path.join(reference_dir, name + '.png')
+    result = {'name': name, 'reference': reference_path}
+
+    if update:
+        os.makedirs(reference_dir, exist_ok=True)
+        with open(reference_path, 'wb') as file:
+            file.write(contents)
+        with open(os.path.join(reference_dir, VERSIONS_FILE), 'w') as file:
+            json.dump(rendering_versions(), file, indent=2, sort_keys=True)
+        result.update(status='updated', passed=True)
+    elif not os.path.isfile(reference_path):
+        result.update(status='missing', passed=False)
+    else:
+        image, reference = read_png(contents), plt.imread(reference_path)
+        result.update(compare_images(image, reference, **thresholds))
+        result['status'] = 'passed' if result['passed'] else 'failed'
+        if not result['passed'] and output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            with open(os.path.join(output_dir, name + '.png'), 'wb') as file:
+                file.write(contents)
+            _write_difference(os.path.join(output_dir, name + '-diff.png'), image, reference)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+def _use_agg():
+    """Pool initializer: render without a display."""
+    matplotlib.use('Agg')
+
+def _check_figure_task(kwargs):
+    return check_figure(**kwargs)
+
+def check_figures(names=None, workers=None, **kwargs):
+    """Check several figures (default: all FIGURES), each in its own worker process.
+
+    Keyword arguments are passed on to `check_figure`.
+
+    Returns:
+    - List of result dicts, in the order of `names`
+    """
+    names = list(FIGURES) if names is None else list(names)
+    tasks = [dict(kwargs, name=name) for name in names]
+    if workers == 1 or len(tasks) == 1:
+        return [check_figure(**task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(tasks)), initializer=_use_agg) as pool:
+        return list(pool.map(_check_figure_task, tasks))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the exercise figures with their reference images.")
+    parser.add_argument('names', nargs='*', help=f"Figures to check (default: {', '.join(FIGURES)})")
+    parser.add_argument('--data', default=DATA_PATH, help=f"Bathymetry subset (default: {DATA_PATH})")
+    parser.add_argument('--references', default=REFERENCE_DIR, help=f"Reference directory (default: {REFERENCE_DIR})")
+    parser.add_argument('-o', '--output', default='reports/figures', help="Directory for images of failed figures")
+    parser.add_argument('--update', action='store_true', help="Rewrite the reference images")
+    args = parser.parse_args(argv)
+
+    if not args.update and not references_match_versions(args.references):
+        print(f"Warning: the references were rendered with {reference_versions(args.references)}, "
+              f"this is {rendering_versions()}; differences may come from the libraries")
+    results = check_figures(args.names or None, data_path=args.data, reference_dir=args.references,
+                            output_dir=args.output, update=args.update)
+    for result in results:
+        details = '' if 'ssim' not in result else f" (SSIM {result['ssim']:.4f}, hash distance {result['hash_distance']})"
+        print(f"{result['name']}: {result['status']}{details} in {result['seconds']:.2f} s")
+    return results
+
+
+if __name__ == '__main__':
+    _use_agg()
+    failed = [result for result in main(sys.argv[1:]) if not result['passed']]
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,179 @@
+import os
+import numpy as np
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.path import Path as _MplPath
+
+from .bathymetry import _as_array, _cell_edges, _coordinates, _fingerprint
+
+__all__ = ['EARTH_RADIUS_M', 'Hypsometry', 'cell_areas', 'rasterize_polygons',
+           'compute_hypsometry', 'basin_volume', 'area_at_depth']
+
+EARTH_RADIUS_M = 6371008.8
+
+Hypsometry = namedtuple('Hypsometry', ['levels', 'area', 'volume', 'fraction', 'total_area', 'total_volume'])
+Hypsometry.__doc__ = """Hypsometry of a region.
+
+- levels: Depth levels (m, negative below sea level, ascending)
+- area: Area (m^2) where the seafloor is deeper than each level
+- volume: Water volume (m^3) below each level
+- fraction: area / total_area, the hypsometric curve
+- total_area: Area (m^2) of all valid grid cells in the region
+- total_volume: Water volume (m^3) below sea level in the region
+"""
+
+# Per-grid cell area factors, see cell_areas()
+_cell_area_cache = {}
+
+
+def _cell_area_factors(lon, lat):
+    """Cell areas factorize into a per-row and a per-column part: R^2 * dsin(lat) * dlon."""
+    key = _fingerprint(lon, lat)
+    if key not in _cell_area_cache:
+        sin_lat_edges = np.sin(np.radians(np.clip(_cell_edges(lat), -90, 90)))
+        row_factor = EARTH_RADIUS_M ** 2 * np.abs(np.diff(sin_lat_edges))
+        col_factor = np.radians(np.abs(np.diff(_cell_edges(lon))))
+        _cell_area_cache[key] = (row_factor, col_factor)
+    return _cell_area_cache[key]
+
+def cell_areas(lon, lat):
+    """Area (m^2) of every cell of a regular lon/lat grid, shape (len(lat), len(lon)).
+
+    The factors are computed once per grid and cached.
+    """
+    row_factor, col_factor = _cell_area_factors(np.asarray(lon, dtype=np.float64),
+                                                np.asarray(lat, dtype=np.float64))
+    return row_factor[:, None] * col_factor[None, :]
+
+def _polygon_rings(polygon):
+    """Exterior and interior rings of a polygon given as vertices or a shapely (Multi)Polygon."""
+    if hasattr(polygon, 'geoms'):
+        return [ring for part in polygon.geoms for ring in _polygon_rings(part)]
+    if hasattr(polygon, 'exterior'):
+        return [(np.asarray(polygon.exterior.coords), [np.asarray(ring.coords) for ring in polygon.interiors])]
+    return [(np.asarray(polygon, dtype=np.float64), [])]
+
+def _polygon_bounds(polygons):
+    vertices = np.concatenate([exterior for polygon in polygons for exterior, _ in _polygon_rings(polygon)])
+    return vertices[:, 0].min(), vertices[:, 0].max(), vertices[:, 1].min(), vertices[:, 1].max()
+
+def rasterize_polygons(lon, lat, polygons):
+    """Label the cells of a lon/lat grid by the polygon their centre lies in.
+
+    Parameters:
+    - lon, lat: 1D grid coordinates
+    - polygons: List of polygons, each a sequence of (lon, lat) vertices or a
+      shapely Polygon/MultiPolygon (holes are respected)
+
+    Returns:
+    - Integer array of shape (len(lat), len(lon)): 0 outside all polygons,
+      i + 1 inside polygons[i] (later polygons win where they overlap)
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    labels = np.zeros((len(lat), len(lon)), dtype=np.int32)
+
+    for label, polygon in enumerate(polygons, start=1):
+        for exterior, interiors in _polygon_rings(polygon):
+            # Only test the cells inside the bounding box of the ring
+            cols = np.flatnonzero((lon >= exterior[:, 0].min()) & (lon <= exterior[:, 0].max()))
+            rows = np.flatnonzero((lat >= exterior[:, 1].min()) & (lat <= exterior[:, 1].max()))
+            if cols.size == 0 or rows.size == 0:
+                continue
+            window = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+            lon2d, lat2d = np.meshgrid(lon[window[1]], lat[window[0]])
+            points = np.column_stack([lon2d.ravel(), lat2d.ravel()])
+
+            inside = _MplPath(exterior).contains_points(points)
+            for interior in interiors:
+                inside &= ~_MplPath(interior).contains_points(points)
+            labels[window][inside.reshape(lon2d.shape)] = label
+    return labels
+
+def _hypsometry_chunk(z, mask, row_factor, col_factor, levels):
+    """Area and area*z histograms of one block of rows over the depth levels."""
+    selected = mask & np.isfinite(z)
+    rows, cols = np.nonzero(selected)
+    depth = z[selected]
+    area = row_factor[rows] * col_factor[cols]
+
+    # Bin b holds the cells with b levels <= z, so z < levels[k] for all bins b <= k
+    bins = np.searchsorted(levels, depth, side='right')
+    area_hist = np.bincount(bins, weights=area, minlength=len(levels) + 1)
+    area_depth_hist = np.bincount(bins, weights=area * depth, minlength=len(levels) + 1)
+    below_sea_level = depth < 0
+    volume = -np.sum(area[below_sea_level] * depth[below_sea_level])
+    return area_hist, area_depth_hist, volume
+
+def compute_hypsometry(dataset, polygon=None, levels=None, workers=None, chunk_rows=256):
+    """Area at depth, volume below depth and hypsometric curve of a region.
+
+    All quantities use the true area of every grid cell on the sphere, and
+    only the grid window around the polygon is read. The rows are processed
+    in chunks in a thread pool.
+
+    Parameters:
+    - dataset: netCDF4 or xarray dataset with lon, lat and z (m, negative below sea level)
+    - polygon: Region as (lon, lat) vertices or a shapely (Multi)Polygon; None for the whole grid
+    - levels: Depth levels (m, negative); defaults to every 100 m from the deepest point to 0
+    - workers: Number of threads (default: all cores)
+    - chunk_rows: Number of grid rows per chunk
+
+    Returns:
+    - Hypsometry namedtuple (levels, area, volume, fraction, total_area, total_volume)
+    """
+    lon, lat = _coordinates(dataset)
+    if polygon is None:
+        window = (slice(0, len(lat)), slice(0, len(lon)))
+    else:
+        lon_min, lon_max, lat_min, lat_max = _polygon_bounds([polygon])
+        cols = np.flatnonzero((lon >= lon_min) & (lon <= lon_max))
+        rows = np.flatnonzero((lat >= lat_min) & (lat <= lat_max))
+        if cols.size == 0 or rows.size == 0:
+            raise ValueError("The polygon does not cover any grid cells")
+        window = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+
+    z = _as_array(dataset.variables['z'][window])
+    row_factor, col_factor = _cell_area_factors(lon, lat)
+    row_factor, col_factor = row_factor[window[0]], col_factor[window[1]]
+    if polygon is None:
+        mask = np.ones(z.shape, dtype=bool)
+    else:
+        mask = rasterize_polygons(lon[window[1]], lat[window[0]], [polygon]) > 0
+
+    if levels is None:
+        deepest = np.nanmin(np.where(mask, z, np.nan))
+        levels = np.arange(np.floor(deepest / 100) * 100, 100, 100)
+    levels = np.sort(np.asarray(levels, dtype=np.float64))
+
+    chunks = [slice(start, start + chunk_rows) for start in range(0, z.shape[0], chunk_rows)]
+    run = lambda rows: _hypsometry_chunk(z[rows], mask[rows], row_factor[rows], col_factor, levels)
+    if len(chunks) == 1 or workers == 1:
+        results = [run(rows) for rows in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            results = list(pool.map(run, chunks))
+
+    area_hist = np.sum([result[0] for result in results], axis=0)
+    area_depth_hist = np.sum([result[1] for result in results], axis=0)
+    total_volume = float(sum(result[2] for result in results))
+
+    area = np.cumsum(area_hist)[:len(levels)]
+    volume = levels * area - np.cumsum(area_depth_hist)[:len(levels)]
+    total_area = float(area_hist.sum())
+    fraction = area / total_area if total_area > 0 else np.full(len(levels), np.nan)
+    return Hypsometry(levels, area, volume, fraction, total_area, total_volume)
+
+def basin_volume(dataset, polygon=None, depth=0.0, **kwargs):
+    """Water volume (m^3) below `depth` (m, e.g. -1000) inside a polygon."""
+    return float(compute_hypsometry(dataset, polygon, levels=[depth], **kwargs).volume[0])
+
+def area_at_depth(dataset, polygon=None, depths=(0.0,), **kwargs):
+    """Area (m^2) inside a polygon where the seafloor is deeper than each of `depths` (m, negative)."""
+    result = compute_hypsometry(dataset, polygon, levels=depths, **kwargs)
+    # Undo the sorting of the levels
+    order = np.argsort(np.asarray(depths, dtype=np.float64), kind='stable')
+    area = np.empty(len(order))
+    area[order] = result.area
+    return area
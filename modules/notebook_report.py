@@ -0,0 +1,308 @@
+"""
+Profiling notebook execution for the autograder.
+
+ProfilingExecutePreprocessor is a drop-in replacement for nbconvert's
+ExecutePreprocessor that records, for every code cell, the wall-clock time,
+CPU time and peak RSS of the kernel. With `profile=True` it also runs the
+cells under cProfile and keeps the top entries of slow cells; cProfile slows
+Python-heavy cells down (about 1.7x for the figure cells), so graded runs
+leave it off and profiling is best done on a separate run of a slow
+submission. Every report states whether its timings were `profiled`. The
+report is available as `preprocessor.report` even when the notebook fails or
+times out, so that the offending cell can be identified.
+
+Reports of many submissions can be combined with `aggregate_reports`:
+
+    python -m modules.notebook_report reports/*.json -o reports/aggregate.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+import datetime
+import numpy as np
+import nbformat
+
+from collections import Counter
+from nbconvert.preprocessors import ExecutePreprocessor
+from traitlets import Bool, Float, Int, Unicode
+
+# Runs inside the kernel: times every cell with IPython's pre/post_run_cell
+# events and appends one JSON line per cell to the report file.
+_KERNEL_SETUP = '''
+def _setup_notebook_profiler(report_path, slow_cell_seconds, top_n, profile):
+    import cProfile, json, pstats, sys, time
+    try:
+        import resource
+        rss_scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, KiB on Linux
+    except ImportError:
+        resource = None
+    internal = {'IPython', 'ipykernel', 'asyncio', 'traitlets', 'tornado', 'zmq'}
+    state = {}
+
+    def peak_rss():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_scale if resource else None
+
+    def pre_run_cell(info):
+        state['profiler'] = None
+        if profile:
+            try:
+                state['profiler'] = cProfile.Profile()
+                state['profiler'].enable()
+            except ValueError:  # another profiler (e.g. %prun) is active
+                state['profiler'] = None
+        state['peak'] = peak_rss()
+        state['cpu'] = time.process_time()
+        state['start'] = time.perf_counter()
+
+    def post_run_cell(result):
+        if state.get('start') is None:
+            return
+        wall = time.perf_counter() - state.pop('start')
+        profiler = state.pop('profiler')
+        if profiler is not None:
+            profiler.disable()
+        peak = peak_rss()
+        record = {
+            'execution_count': result.execution_count,
+            'kernel_seconds': wall,
+            'cpu_seconds': time.process_time() - state['cpu'],
+            'peak_rss_bytes': peak,
+            'rss_increase_bytes': None if peak is None else peak - state['peak'],
+        }
+        if profiler is not None and wall >= slow_cell_seconds:
+            entries = [
+                {'function': name, 'file': filename, 'line': line, 'calls': calls,
+                 'own_seconds': own, 'cumulative_seconds': cumulative}
+                for (filename, line, name), (_, calls, own, cumulative, _) in pstats.Stats(profiler).stats.items()
+                if not internal.intersection(filename.replace('\\\\', '/').split('/'))
+                and name not in ('<built-in method builtins.exec>', '<built-in method builtins.compile>')
+                and cumulative >= 0.001
+            ]
+            entries.sort(key=lambda entry: entry['cumulative_seconds'], reverse=True)
+            record['profile'] = entries[:top_n]
+        with open(report_path, 'a') as file:
+            file.write(json.dumps(record) + '\\n')
+
+    ip = get_ipython()
+    ip.events.register('pre_run_cell', pre_run_cell)
+    ip.events.register('post_run_cell', post_run_cell)
+'''
+
+
+def _megabytes(value):
+    return None if value is None else round(value / 2**20, 1)
+
+
+class ProfilingExecutePreprocessor(ExecutePreprocessor):
+    """ExecutePreprocessor that produces a per-cell timing, memory and profile report."""
+
+    slow_cell_seconds = Float(1.0, help="Collect profile entries for cells slower than this").tag(config=True)
+    top_n = Int(15, help="Number of profile entries to keep per slow cell").tag(config=True)
+    profile = Bool(False, help="Run cells under cProfile (slows them down, so not for graded runs)").tag(config=True)
+    submission = Unicode('', help="Identifier of the submission stored in the report").tag(config=True)
+    interrupt_grace_seconds = Float(5.0, help="After interrupting a timed-out cell, wait this long for its "
+                                               "record before giving up on it").tag(config=True)
+
+    def __init__(self, **kwargs):
+        # Interrupt a cell on timeout, so that its record is still written, but
+        # end the cell right away instead of waiting for the kernel's reply: code
+        # that swallows KeyboardInterrupt would otherwise never finish
+        kwargs.setdefault('interrupt_on_timeout', True)
+        super().__init__(**kwargs)
+        if self.error_on_timeout is None:
+            self.error_on_timeout = {'ename': 'CellTimeoutError',
+                                     'evalue': f"Cell execution timed out after {self.timeout} s",
+                                     'traceback': []}
+        self.report = None
+
+    def preprocess(self, nb, resources=None, km=None):
+        self._cells = []
+        self._kernel_ready = False
+        self._timed_out = False
+        self._status = 'ok'
+        self._error = None
+        started = time.perf_counter()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self._records_path = os.path.join(temp_dir, 'cells.jsonl')
+            try:
+                return super().preprocess(nb, resources, km)
+            except BaseException as error:
+                if self._timed_out:
+                    self._status = 'timeout'
+                    self._error = f"Cell execution timed out after {self.timeout} s"
+                else:
+                    # CellExecutionError carries the name and message of the error raised in the kernel
+                    self._status = 'error'
+                    self._error = f"{getattr(error, 'ename', type(error).__name__)}: {getattr(error, 'evalue', error)}"[:500]
+                raise
+            finally:
+                self.report = self._build_report(time.perf_counter() - started)
+
+    def _record_count(self):
+        if not os.path.isfile(self._records_path):
+            return 0
+        with open(self._records_path) as file:
+            return sum(1 for _ in file)
+
+    async def _async_handle_timeout(self, timeout, cell=None):
+        self._timed_out = True
+        reply = await super()._async_handle_timeout(timeout, cell)
+        # Give an interrupted cell a moment to write its record; bounded, since
+        # the interrupt may be swallowed
+        deadline = time.perf_counter() + self.interrupt_grace_seconds
+        while self._record_count() <= self._records_before and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        return reply
+
+    def preprocess_cell(self, cell, resources, index):
+        if cell.cell_type != 'code' or not cell.source.strip():
+            return super().preprocess_cell(cell, resources, index)
+
+        if not self._kernel_ready:
+            setup = (_KERNEL_SETUP +
+                     f"_setup_notebook_profiler({self._records_path!r}, {self.slow_cell_seconds!r}, "
+                     f"{self.top_n!r}, {self.profile!r})\ndel _setup_notebook_profiler\n")
+            self.execute_cell(nbformat.v4.new_code_cell(setup), index, store_history=False)
+            self._kernel_ready = True
+
+        self._records_before = self._record_count()
+        entry = {'index': index, 'source': cell.source.strip().splitlines()[0][:80], 'status': 'ok'}
+        self._cells.append(entry)
+        started = time.perf_counter()
+        try:
+            return super().preprocess_cell(cell, resources, index)
+        except BaseException:
+            entry['status'] = 'timeout' if self._timed_out else 'error'
+            raise
+        finally:
+            entry['wall_seconds'] = round(time.perf_counter() - started, 3)
+            entry['execution_count'] = cell.get('execution_count')
+
+    def _build_report(self, total_seconds):
+        records = {}
+        if os.path.isfile(self._records_path):
+            with open(self._records_path) as file:
+                for line in file:
+                    record = json.loads(line)
+                    records[record['execution_count']] = record
+
+        cells = []
+        for entry in self._cells:
+            record = records.get(entry['execution_count'], {})
+            cells.append({
+                **entry,
+                'kernel_seconds': None if 'kernel_seconds' not in record else round(record['kernel_seconds'], 3),
+                'cpu_seconds': None if 'cpu_seconds' not in record else round(record['cpu_seconds'], 3),
+                'peak_rss_mb': _megabytes(record.get('peak_rss_bytes')),
+                'rss_increase_mb': _megabytes(record.get('rss_increase_bytes')),
+                'profile': record.get('profile', []),
+            })
+
+        peaks = [cell['peak_rss_mb'] for cell in cells if cell['peak_rss_mb'] is not None]
+        return {
+            'submission': self.submission,
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'status': self._status,
+            'error': self._error,
+            'timeout_seconds': self.timeout,
+            'profiled': self.profile,
+            'total_seconds': round(total_seconds, 3),
+            'peak_rss_mb': max(peaks) if peaks else None,
+            'cells': cells,
+        }
+
+
+def slowest_cells(report, n=3):
+    """The n slowest cells of a report as short human-readable strings."""
+    cells = sorted(report['cells'], key=lambda cell: cell['wall_seconds'], reverse=True)[:n]
+    return [f"cell {cell['index']} ({cell['status']}, {cell['wall_seconds']:.1f} s, "
+            f"{cell['peak_rss_mb']} MB): {cell['source']}" for cell in cells]
+
+def write_report(report, path):
+    """Write a report as JSON, creating the directory if needed."""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+def aggregate_reports(reports):
+    """Combine the reports of many submissions of the same notebook.
+
+    Cells are matched by their index in the notebook. The suggested timeout is
+    twice the 95th percentile of the total execution time; reports whose
+    timings were profiled are counted in 'profiled_submissions', as they
+    overestimate it.
+    """
+    totals = np.array([report['total_seconds'] for report in reports], dtype=np.float64)
+    by_cell = {}
+    for report in reports:
+        for cell in report['cells']:
+            by_cell.setdefault(cell['index'], []).append((report['submission'], cell))
+
+    cells = []
+    for index, runs in by_cell.items():
+        seconds = np.array([cell['wall_seconds'] for _, cell in runs])
+        peaks = [cell['peak_rss_mb'] for _, cell in runs if cell['peak_rss_mb'] is not None]
+        slowest_submission, _ = max(runs, key=lambda run: run[1]['wall_seconds'])
+        cells.append({
+            'index': index,
+            'source': Counter(cell['source'] for _, cell in runs).most_common(1)[0][0],
+            'runs': len(runs),
+            'median_seconds': round(float(np.median(seconds)), 3),
+            'p95_seconds': round(float(np.percentile(seconds, 95)), 3),
+            'max_seconds': round(float(seconds.max()), 3),
+            'max_peak_rss_mb': max(peaks) if peaks else None,
+            'errors': sum(cell['status'] == 'error' for _, cell in runs),
+            'timeouts': sum(cell['status'] == 'timeout' for _, cell in runs),
+            'slowest_submission': slowest_submission,
+        })
+    cells.sort(key=lambda cell: cell['p95_seconds'], reverse=True)
+
+    return {
+        'submissions': len(reports),
+        'status': dict(Counter(report['status'] for report in reports)),
+        'profiled_submissions': sum(bool(report.get('profiled')) for report in reports),
+        'total_seconds': {
+            'median': round(float(np.median(totals)), 3) if len(totals) else None,
+            'p95': round(float(np.percentile(totals, 95)), 3) if len(totals) else None,
+            'max': round(float(totals.max()), 3) if len(totals) else None,
+        },
+        'suggested_timeout_seconds': math.ceil(2 * np.percentile(totals, 95)) if len(totals) else None,
+        'cells': cells,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate notebook execution reports of many submissions.")
+    parser.add_argument('reports', nargs='+', help="Report JSON files")
+    parser.add_argument('-o', '--output', help="Write the aggregate report to this JSON file")
+    parser.add_argument('-n', '--top', type=int, default=5, help="Number of slowest cells to print")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for path in args.reports:
+        with open(path) as file:
+            reports.append(json.load(file))
+    aggregate = aggregate_reports(reports)
+    if args.output:
+        write_report(aggregate, args.output)
+
+    print(f"{aggregate['submissions']} submissions: {aggregate['status']}")
+    print(f"Total time: median {aggregate['total_seconds']['median']} s, p95 {aggregate['total_seconds']['p95']} s, "
+          f"max {aggregate['total_seconds']['max']} s (suggested timeout {aggregate['suggested_timeout_seconds']} s)")
+    if aggregate['profiled_submissions']:
+        print(f"Note: {aggregate['profiled_submissions']} reports were run under cProfile, so their times are too long")
+    for cell in aggregate['cells'][:args.top]:
+        print(f"  cell {cell['index']:>3}: p95 {cell['p95_seconds']:>8.2f} s, max {cell['max_seconds']:>8.2f} s, "
+              f"{cell['timeouts']} timeouts, {cell['errors']} errors - {cell['source']}")
+    return aggregate
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,249 @@
+import numpy as np
+import contourpy
+import matplotlib as mpl
+
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba_array
+from matplotlib.lines import _get_dash_pattern, _scale_dashes
+
+__all__ = ['simplify_lines', 'decimated_contour', 'decimate_points', 'decimated_scatter']
+
+
+def _dpi_scale(ax, dpi=None):
+    """Ratio of the DPI the figure will be saved with to the figure's own DPI."""
+    if dpi is None:
+        dpi = mpl.rcParams['savefig.dpi']
+    return 1.0 if dpi == 'figure' else dpi / ax.figure.dpi
+
+def _pixel_transform(ax, transform=None, dpi=None):
+    """Function mapping (N, 2) data coordinates to pixels of the saved figure.
+
+    The axes extent (e.g. `ax.set_extent`) must be set before calling this.
+    """
+    if transform is None:
+        to_display = ax.transData
+    elif hasattr(transform, '_as_mpl_transform'):
+        # cartopy CRS: projection to the map plus the axes' data transform
+        to_display = transform._as_mpl_transform(ax)
+    else:
+        to_display = transform
+    scale = _dpi_scale(ax, dpi)
+    return lambda xy: to_display.transform(xy) * scale
+
+def _drop_repeated_pixels(pixels, cell_size, first, last):
+    """Mask of the vertices that do not fall into the same square cell as their predecessor.
+
+    The first and last vertex of every line are always kept.
+    """
+    cells = np.floor(pixels / max(cell_size, 1e-12))
+    keep = np.ones(len(pixels), dtype=bool)
+    keep[1:] = np.any(cells[1:] != cells[:-1], axis=1)
+    keep[first] = True
+    keep[last] = True
+    return keep
+
+def _douglas_peucker(points, tolerance, starts, ends):
+    """Mask of the vertices kept by Douglas-Peucker simplification of the lines points[starts[i]:ends[i] + 1].
+
+    Instead of recursing per segment, every round splits all open segments
+    of all lines at once at their farthest vertex.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[starts] = True
+    keep[ends] = True
+    starts, ends = np.asarray(starts), np.asarray(ends)
+    while True:
+        inner = ends - starts - 1
+        open_segments = inner > 0
+        starts, ends, inner = starts[open_segments], ends[open_segments], inner[open_segments]
+        if starts.size == 0:
+            return keep
+
+        # Indices of the inner vertices of all segments, and the segment of each
+        offsets = np.cumsum(inner) - inner
+        segment = np.repeat(np.arange(len(starts)), inner)
+        index = np.arange(inner.sum()) - offsets[segment] + starts[segment] + 1
+
+        # Distance to the segment (not the infinite line), so that back-tracking lines are kept
+        a = points[starts][segment]
+        direction = (points[ends] - points[starts])[segment]
+        length_squared = np.einsum('ij,ij->i', direction, direction)
+        relative = points[index] - a
+        t = np.einsum('ij,ij->i', relative, direction) / np.where(length_squared > 0, length_squared, 1)
+        offset = relative - np.clip(t, 0, 1)[:, None] * direction
+        distance = np.hypot(offset[:, 0], offset[:, 1])
+
+        farthest = np.maximum.reduceat(distance, offsets)
+        first_farthest = np.flatnonzero(distance == farthest[segment])
+        _, unique = np.unique(segment[first_farthest], return_index=True)
+        split = farthest > tolerance
+        splits = index[first_farthest[unique]][split]
+        keep[splits] = True
+        starts, ends = np.concatenate([starts[split], splits]), np.concatenate([splits, ends[split]])
+
+def simplify_lines(lines, tolerance=0.5):
+    """Simplify lines given in pixels so that they deviate by at most `tolerance` pixels.
+
+    Vertices that lie in the same small cell as their predecessor are dropped
+    first, then the rest is simplified with Douglas-Peucker, for all lines at
+    once. Each step uses half of the tolerance.
+
+    Returns:
+    - List with the indices of the vertices to keep for every line
+    """
+    if len(lines) == 0:
+        return []
+    bounds = np.cumsum([0] + [len(line) for line in lines])
+    points = np.concatenate([np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines])
+    first, last = bounds[:-1], bounds[1:] - 1
+    nonempty = last >= first
+    first, last = first[nonempty], last[nonempty]
+
+    # Cells with a diagonal of half the tolerance
+    candidates = np.flatnonzero(_drop_repeated_pixels(points, tolerance / 2 / np.sqrt(2), first, last))
+    kept = _douglas_peucker(points[candidates], tolerance / 2,
+                            np.searchsorted(candidates, first), np.searchsorted(candidates, last))
+    kept = candidates[kept]
+    return [indices - start for indices, start in zip(np.split(kept, np.searchsorted(kept, bounds[1:-1])), bounds)]
+
+def _cut_dashes(line, pixels, offset, dashes):
+    """Cut a line into the dashes of a dash pattern, measured along the full-resolution line.
+
+    Simplified lines are slightly shorter than the originals, so a dash pattern
+    applied to them drifts along the line. Cutting the dashes first keeps them
+    where matplotlib would draw them on the full line.
+
+    Parameters:
+    - line, pixels: (N, 2) vertices in data coordinates and in pixels
+    - offset, dashes: Dash offset and on/off lengths in pixels
+
+    Returns:
+    - Lists of the dashes in data coordinates and in pixels
+    """
+    if len(dashes) % 2:
+        dashes = list(dashes) * 2
+    distance = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(pixels, axis=0).T))])
+    period = sum(dashes)
+    on_starts = np.cumsum([0.0, *dashes])[:-1:2]
+    periods = np.arange(-1, distance[-1] // period + 2)[:, None] * period - offset
+    starts = np.maximum((periods + on_starts).ravel(), 0.0)
+    stops = np.minimum((periods + on_starts + np.asarray(dashes[::2])).ravel(), distance[-1])
+    visible = stops > starts
+    starts, stops = starts[visible], stops[visible]
+
+    def at(values, positions):
+        return np.column_stack([np.interp(positions, distance, values[:, 0]),
+                                np.interp(positions, distance, values[:, 1])])
+
+    first = np.searchsorted(distance, starts, side='right')
+    last = np.searchsorted(distance, stops, side='left')
+    pieces = ([], [])
+    for values, pieces_of in zip((line, pixels), pieces):
+        start_points, stop_points = at(values, starts), at(values, stops)
+        pieces_of.extend(np.vstack([start_points[i], values[first[i]:last[i]], stop_points[i]])
+                         for i in range(len(starts)))
+    return pieces
+
+def decimated_contour(ax, lon, lat, z, levels, transform=None, dpi=None, tolerance=0.5, **kwargs):
+    """Draw contour lines simplified to the resolution of the saved figure.
+
+    Dense isobaths on fine grids have many vertices closer together than one
+    pixel. The lines are traced with contourpy (as `ax.contour` does),
+    projected to pixels and simplified to `tolerance` pixels, and drawn as one
+    LineCollection. Dashed lines are cut into their dashes before they are
+    simplified, so that the dashes stay in place. Set the figure size and map
+    extent before calling this.
+
+    Parameters:
+    - ax: Matplotlib or cartopy axes
+    - lon, lat: 1D or 2D grid coordinates; z: 2D values (NaN is masked)
+    - levels: Contour levels
+    - transform: Coordinate system of lon/lat, e.g. `ccrs.PlateCarree()` on a cartopy axes
+    - dpi: DPI the figure will be saved with (default: rcParams['savefig.dpi'])
+    - tolerance: Maximum deviation from the full-resolution lines in pixels
+    - kwargs: Passed on to LineCollection (colors, linewidths, linestyles, cmap, ...).
+      As with `ax.contour`, lines of negative levels in a single colour are drawn
+      with `negative_linestyles` (default: rcParams['contour.negative_linestyle'])
+      unless `linestyles` is given
+
+    Returns:
+    - LineCollection, coloured by level through `cmap` unless `colors` is given
+    """
+    levels = np.atleast_1d(np.asarray(levels, dtype=np.float64))
+    negative_linestyles = kwargs.pop('negative_linestyles', None) or mpl.rcParams['contour.negative_linestyle']
+    generator = contourpy.contour_generator(lon, lat, np.ma.masked_invalid(z), line_type='Separate')
+    to_pixels = _pixel_transform(ax, transform, dpi)
+
+    lines, line_levels = [], []
+    for level in levels:
+        for line in generator.lines(level):
+            lines.append(line)
+            line_levels.append(level)
+    pixels = to_pixels(np.concatenate(lines)) if lines else np.empty((0, 2))
+    pixel_lines = np.split(pixels, np.cumsum([len(line) for line in lines])[:-1])
+
+    colors = kwargs.get('colors', kwargs.get('color'))
+    linestyles = kwargs.pop('linestyles', kwargs.pop('linestyle', None))
+    if linestyles is None and colors is not None and len(np.unique(to_rgba_array(colors), axis=0)) == 1:
+        linestyles = [negative_linestyles if level < 0 else 'solid' for level in line_levels]
+    elif isinstance(linestyles, (str, tuple)):
+        linestyles = [linestyles] * len(lines)
+    linewidth = kwargs.get('linewidths', kwargs.get('linewidth', mpl.rcParams['lines.linewidth']))
+
+    # Cut dashed lines into solid dashes (only for one linestyle per line and one linewidth)
+    if linestyles is not None and len(linestyles) == len(lines) and np.ndim(linewidth) == 0:
+        pixels_per_point = ax.figure.dpi * _dpi_scale(ax, dpi) / 72
+        cut_lines, cut_pixels, cut_levels, cut_styles = [], [], [], []
+        for line, pixel_line, level, style in zip(lines, pixel_lines, line_levels, linestyles):
+            offset, dashes = _scale_dashes(*_get_dash_pattern(style), linewidth)
+            if dashes is None or sum(dashes) <= 0 or len(line) < 2:
+                cut_lines.append(line)
+                cut_pixels.append(pixel_line)
+                cut_levels.append(level)
+                cut_styles.append(style)
+                continue
+            dash_lines, dash_pixels = _cut_dashes(line, pixel_line, offset * pixels_per_point,
+                                                  [dash * pixels_per_point for dash in dashes])
+            cut_lines += dash_lines
+            cut_pixels += dash_pixels
+            cut_levels += [level] * len(dash_lines)
+            cut_styles += ['solid'] * len(dash_lines)
+        lines, pixel_lines, line_levels, linestyles = cut_lines, cut_pixels, cut_levels, cut_styles
+    if linestyles is not None:
+        kwargs['linestyles'] = linestyles
+    segments = [line[keep] for line, keep in zip(lines, simplify_lines(pixel_lines, tolerance))]
+
+    if transform is not None:
+        kwargs['transform'] = transform
+    collection = LineCollection(segments, **kwargs)
+    if 'colors' not in kwargs and 'color' not in kwargs:
+        collection.set_array(np.asarray(line_levels))
+        collection.set_clim(levels.min(), levels.max())
+    ax.add_collection(collection, autolim=transform is None)
+    return collection
+
+def decimate_points(ax, lon, lat, transform=None, dpi=None, cell_pixels=1.0):
+    """Indices of the points to draw so that at most one falls into every `cell_pixels` square.
+
+    The last point of every square is kept, as it is the one drawn on top.
+    Points outside the axes are dropped as well.
+    """
+    pixels = _pixel_transform(ax, transform, dpi)(np.column_stack([np.ravel(lon), np.ravel(lat)]))
+    x_min, y_min, x_max, y_max = ax.bbox.extents * _dpi_scale(ax, dpi)
+    visible = np.flatnonzero(np.all(np.isfinite(pixels), axis=1) &
+                             (pixels[:, 0] >= x_min) & (pixels[:, 0] <= x_max) &
+                             (pixels[:, 1] >= y_min) & (pixels[:, 1] <= y_max))
+    cells = np.floor(pixels[visible] / cell_pixels).astype(np.int64)
+    _, last = np.unique(cells[::-1], axis=0, return_index=True)
+    return visible[np.sort(len(cells) - 1 - last)]
+
+def decimated_scatter(ax, lon, lat, c=None, s=None, transform=None, dpi=None, cell_pixels=1.0, **kwargs):
+    """`ax.scatter` of only the points returned by `decimate_points` (c and s are subset to match)."""
+    keep = decimate_points(ax, lon, lat, transform, dpi, cell_pixels)
+    if c is not None and np.ndim(c) > 0 and np.size(c) == np.size(lon):
+        c = np.ravel(c)[keep]
+    if s is not None and np.ndim(s) > 0:
+        s = np.ravel(s)[keep]
+    if transform is not None:
+        kwargs['transform'] = transform
+    return ax.scatter(np.ravel(lon)[keep], np.ravel(lat)[keep], c=c, s=s, **kwargs)
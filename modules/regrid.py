@@ -0,0 +1,287 @@
+import os
+import numpy as np
+import xarray as xr
+
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from .bathymetry import _as_array, _cell_edges, _coordinates, _fingerprint
+from .stations import _unit_vectors
+
+__all__ = ['REGRID_METHODS', 'Regridder', 'get_regridder', 'regrid_bathymetry']
+
+REGRID_METHODS = ('conservative', 'bilinear', 'min', 'max')
+
+# Regridders are expensive to build and cheap to apply, so they are kept per
+# (method, source grid, target grid)
+_regridder_cache = {}
+
+
+def _source_window(axis, lo, hi):
+    """Slice of a regular source axis covering [lo, hi] plus one cell of margin on each side."""
+    start = max(np.searchsorted(axis, lo) - 1, 0)
+    stop = min(np.searchsorted(axis, hi, side='right') + 1, len(axis))
+    return slice(int(start), int(stop))
+
+def _overlap_matrix(source_edges, target_edges):
+    """Sparse matrix of the overlap length of every target interval with every source interval."""
+    rows, cols, values = [], [], []
+    for i in range(len(target_edges) - 1):
+        lo, hi = target_edges[i], target_edges[i + 1]
+        j = np.arange(max(np.searchsorted(source_edges, lo, side='right') - 1, 0),
+                      min(np.searchsorted(source_edges, hi), len(source_edges) - 1))
+        overlap = np.minimum(hi, source_edges[j + 1]) - np.maximum(lo, source_edges[j])
+        # Ignore slivers that only come from rounding where edges coincide (coordinates
+        # are often stored as float32)
+        keep = overlap > 1e-3 * (source_edges[j + 1] - source_edges[j])
+        rows.append(np.full(keep.sum(), i))
+        cols.append(j[keep])
+        values.append(overlap[keep])
+    return sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(len(target_edges) - 1, len(source_edges) - 1))
+
+def _source_cell_areas(source_lon, source_lat):
+    """Relative source cell areas on the sphere: delta lon * delta sin(lat)."""
+    lon_edges = _cell_edges(source_lon)
+    sin_lat_edges = np.sin(np.radians(np.clip(_cell_edges(source_lat), -90, 90)))
+    return np.diff(sin_lat_edges)[:, None] * np.diff(lon_edges)[None, :]
+
+def _conservative_weights_regular(source_lon, source_lat, target_lon, target_lat):
+    """Exact area-overlap weights between two regular lon/lat grids.
+
+    The overlap in latitude is measured in sin(lat), so the weights are
+    proportional to the true overlap area on the sphere.
+    """
+    lon_weights = _overlap_matrix(_cell_edges(source_lon), _cell_edges(target_lon))
+    lat_weights = _overlap_matrix(
+        np.sin(np.radians(np.clip(_cell_edges(source_lat), -90, 90))),
+        np.sin(np.radians(np.clip(_cell_edges(target_lat), -90, 90))),
+    )
+    # Cells are ordered (lat, lon), as in z.ravel()
+    return sparse.kron(lat_weights, lon_weights, format='csr')
+
+def _conservative_weights_curvilinear(source_lon, source_lat, target_lon, target_lat):
+    """Area weights assigning every source cell to the target cell whose centre is nearest.
+
+    For curvilinear grids the target cell boundaries are not known, so target
+    cells are approximated by the Voronoi cells of their centres. Source cells
+    further than half a cell diagonal from any target centre are left out.
+    """
+    target_xyz = _unit_vectors(target_lat, target_lon)
+    tree = cKDTree(target_xyz.reshape(-1, 3))
+
+    # Local grid spacing of the target grid in both directions (chord lengths)
+    spacing = np.zeros(target_lon.shape)
+    for axis in (0, 1):
+        if target_lon.shape[axis] > 1:
+            step = np.linalg.norm(np.diff(target_xyz, axis=axis), axis=-1)
+            before = np.concatenate([step.take([0], axis=axis), step], axis=axis)
+            after = np.concatenate([step, step.take([-1], axis=axis)], axis=axis)
+            spacing = np.maximum(spacing, np.maximum(before, after))
+    radius = spacing * np.sqrt(2) / 2
+
+    lon2d, lat2d = np.meshgrid(source_lon, source_lat)
+    distance, index = tree.query(_unit_vectors(lat2d.ravel(), lon2d.ravel()), workers=-1)
+    keep = distance <= radius.ravel()[index]
+
+    areas = _source_cell_areas(source_lon, source_lat).ravel()
+    return sparse.csr_matrix((areas[keep], (index[keep], np.flatnonzero(keep))),
+                             shape=(target_lon.size, source_lon.size * source_lat.size))
+
+def _bilinear_weights(source_lon, source_lat, target_lon, target_lat):
+    """Bilinear interpolation weights from a regular source grid to arbitrary target points."""
+    x = np.ravel(target_lon)
+    y = np.ravel(target_lat)
+
+    def fractional_index(axis, values):
+        i = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, len(axis) - 2)
+        t = (values - axis[i]) / (axis[i + 1] - axis[i])
+        inside = (values >= axis[0]) & (values <= axis[-1])
+        return i, t, inside
+
+    j, tx, inside_lon = fractional_index(source_lon, x)
+    i, ty, inside_lat = fractional_index(source_lat, y)
+    inside = inside_lon & inside_lat
+    target = np.flatnonzero(inside)
+    i, j, tx, ty = i[inside], j[inside], tx[inside], ty[inside]
+
+    nx = len(source_lon)
+    rows = np.repeat(target, 4)
+    cols = np.stack([i * nx + j, i * nx + j + 1, (i + 1) * nx + j, (i + 1) * nx + j + 1], axis=1).ravel()
+    values = np.stack([(1 - ty) * (1 - tx), (1 - ty) * tx, ty * (1 - tx), ty * tx], axis=1).ravel()
+    return sparse.csr_matrix((values, (rows, cols)), shape=(x.size, nx * len(source_lat)))
+
+def _reduce_rows(weights, values, ufunc):
+    """Apply a reduction (np.fmin/np.fmax) over the source cells of every row of a sparse matrix."""
+    result = np.full(weights.shape[0], np.nan)
+    non_empty = np.diff(weights.indptr) > 0
+    if non_empty.any():
+        result[non_empty] = ufunc.reduceat(values[weights.indices], weights.indptr[:-1][non_empty])
+    return result
+
+
+class Regridder:
+    """Map bathymetry from a regular lon/lat source grid onto a target grid.
+
+    The sparse weight matrix (target cells x source cells) is computed once when
+    the regridder is created and can then be applied to any number of fields.
+    Only the source window covering the target grid is used, see `source_window`.
+
+    Parameters:
+    - source_lon, source_lat: 1D ascending coordinates of the source grid (e.g. ETOPO)
+    - target_lon, target_lat: 1D monotonic (ascending or descending) coordinates of a
+      regular target grid, or 2D arrays of cell centres of a curvilinear target grid
+      (same longitude convention)
+    - method: 'conservative' (area-weighted mean), 'min', 'max' or 'bilinear'
+    - chunk_size: Number of target cells per chunk when applying the weights
+    """
+
+    def __init__(self, source_lon, source_lat, target_lon, target_lat, method='conservative',
+                 chunk_size=65536):
+        if method not in REGRID_METHODS:
+            raise ValueError(f"Unknown regridding method '{method}', use one of {REGRID_METHODS}")
+        source_lon = np.asarray(source_lon, dtype=np.float64)
+        source_lat = np.asarray(source_lat, dtype=np.float64)
+        target_lon = np.asarray(target_lon, dtype=np.float64)
+        target_lat = np.asarray(target_lat, dtype=np.float64)
+        if np.any(np.diff(source_lon) <= 0) or np.any(np.diff(source_lat) <= 0):
+            raise ValueError("Source coordinates must be strictly ascending")
+
+        if target_lon.ndim == 1 and target_lat.ndim == 1:
+            self.curvilinear = False
+            self.target_shape = (len(target_lat), len(target_lon))
+            flip = []
+            for name, axis in (('lat', target_lat), ('lon', target_lon)):
+                step = np.diff(axis)
+                if not (np.all(step > 0) or np.all(step < 0)):
+                    raise ValueError(f"Target {name} must be strictly ascending or descending")
+                flip.append(len(step) > 0 and step[0] < 0)
+        elif target_lon.ndim == 2 and target_lon.shape == target_lat.shape:
+            self.curvilinear = True
+            self.target_shape = target_lon.shape
+        else:
+            raise ValueError("Target lon/lat must both be 1D (regular) or 2D with the same shape (curvilinear)")
+
+        self.method = method
+        self.target_lon = target_lon
+        self.target_lat = target_lat
+
+        # Restrict the source grid to the part covered by the target grid
+        half_cell = 0.0
+        if method != 'bilinear' and target_lon.size > 1:
+            half_cell = max(np.abs(np.diff(target_lon, axis=-1)).max(initial=0),
+                            np.abs(np.diff(target_lat, axis=0)).max(initial=0))
+        rows = _source_window(source_lat, target_lat.min() - half_cell, target_lat.max() + half_cell)
+        cols = _source_window(source_lon, target_lon.min() - half_cell, target_lon.max() + half_cell)
+        self.source_window = (rows, cols)
+        self.source_shape = (rows.stop - rows.start, cols.stop - cols.start)
+        source_lon = source_lon[cols]
+        source_lat = source_lat[rows]
+
+        if method == 'bilinear':
+            if self.curvilinear:
+                weights = _bilinear_weights(source_lon, source_lat, target_lon, target_lat)
+            else:
+                weights = _bilinear_weights(source_lon, source_lat, *np.meshgrid(target_lon, target_lat))
+        elif self.curvilinear:
+            weights = _conservative_weights_curvilinear(source_lon, source_lat, target_lon, target_lat)
+        else:
+            # The overlaps are computed on ascending axes, descending target axes are
+            # flipped back by reordering the rows of the weights
+            weights = _conservative_weights_regular(source_lon, source_lat, np.sort(target_lon),
+                                                    np.sort(target_lat))
+            if any(flip):
+                order = np.arange(weights.shape[0]).reshape(self.target_shape)
+                order = order[::-1 if flip[0] else 1, ::-1 if flip[1] else 1]
+                weights = weights[order.ravel()]
+        weights.sum_duplicates()
+        weights.eliminate_zeros()
+        self.weights = weights
+
+        # Split the weights into row blocks once so that apply() can run them in parallel
+        n_target = weights.shape[0]
+        self._chunks = [(start, weights[start:start + chunk_size])
+                        for start in range(0, n_target, chunk_size)]
+
+    @classmethod
+    def from_dataset(cls, dataset, target_lon, target_lat, method='conservative', **kwargs):
+        """Create a regridder from the coordinates of a netCDF4 or xarray bathymetry dataset."""
+        lon, lat = _coordinates(dataset)
+        return cls(lon, lat, target_lon, target_lat, method=method, **kwargs)
+
+    def _apply_chunk(self, block, values, filled, valid):
+        if self.method == 'min':
+            return _reduce_rows(block, values, np.fmin)
+        if self.method == 'max':
+            return _reduce_rows(block, values, np.fmax)
+
+        # Weighted mean over valid source cells only, so NaNs (e.g. land masks) don't spread
+        numerator = block @ filled
+        denominator = block @ valid
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(denominator > 0, numerator / denominator, np.nan)
+
+    def apply(self, z, workers=None):
+        """Regrid a 2D field on the source window to the target grid.
+
+        Parameters:
+        - z: Array of shape `source_shape` (use `source_window` to cut it out)
+        - workers: Number of threads to apply the weight chunks with (default: all cores)
+
+        Returns:
+        - Array of shape `target_shape` (NaN where no source data is available)
+        """
+        values = _as_array(z)
+        if values.shape != self.source_shape:
+            raise ValueError(f"Expected a field of shape {self.source_shape}, got {values.shape}")
+        values = values.ravel()
+        valid = np.isfinite(values)
+        filled = np.where(valid, values, 0.0)
+        valid = valid.astype(np.float64)
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(self._chunks) == 1:
+            results = [self._apply_chunk(block, values, filled, valid) for _, block in self._chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(lambda chunk: self._apply_chunk(chunk[1], values, filled, valid),
+                                        self._chunks))
+        return np.concatenate(results).reshape(self.target_shape)
+
+    __call__ = apply
+
+
+def get_regridder(source_lon, source_lat, target_lon, target_lat, method='conservative'):
+    """Return a cached Regridder for this pair of grids, building it on first use."""
+    key = (method, _fingerprint(source_lon, source_lat), _fingerprint(target_lon, target_lat))
+    if key not in _regridder_cache:
+        _regridder_cache[key] = Regridder(source_lon, source_lat, target_lon, target_lat, method=method)
+    return _regridder_cache[key]
+
+def regrid_bathymetry(dataset, target_lon, target_lat, method='conservative', workers=None):
+    """Regrid the bathymetry of a netCDF4 or xarray dataset onto a target grid.
+
+    Only the source window covering the target grid is read from the dataset,
+    and the weights are reused for repeated calls with the same grids.
+
+    Parameters:
+    - dataset: Dataset with lon, lat and z variables (e.g. from `get_bathymetry_data()`)
+    - target_lon, target_lat: 1D (regular) or 2D (curvilinear) target coordinates
+    - method: 'conservative', 'min', 'max' or 'bilinear'
+    - workers: Number of threads used to apply the weights
+
+    Returns:
+    - xarray DataArray `z` on the target grid
+    """
+    lon, lat = _coordinates(dataset)
+    regridder = get_regridder(lon, lat, target_lon, target_lat, method=method)
+    rows, cols = regridder.source_window
+    depth = regridder(_as_array(dataset.variables['z'][rows, cols]), workers=workers)
+
+    if regridder.curvilinear:
+        return xr.DataArray(depth, dims=('y', 'x'), name='z',
+                            coords={'lon': (('y', 'x'), regridder.target_lon),
+                                    'lat': (('y', 'x'), regridder.target_lat)})
+    return xr.DataArray(depth, dims=('lat', 'lon'), name='z',
+                        coords={'lat': regridder.target_lat, 'lon': regridder.target_lon})
@@ -0,0 +1,164 @@
+import sys
+import weakref
+import numpy as np
+import xarray as xr
+
+from multiprocessing import resource_tracker, shared_memory
+
+from .bathymetry import BathymetryDataSingleton, _as_array, _coordinates, get_subset_index_ranges
+
+__all__ = ['SharedGrid', 'publish_bathymetry', 'attach_bathymetry', 'subset_from_singleton']
+
+# Start of every array in the shared block is aligned to this many bytes
+_ALIGNMENT = 64
+
+# Grids attached by pool workers, kept here so that their memory stays mapped
+_attached_grids = []
+
+
+def _attach_untracked(name):
+    """Attach to an existing shared memory block without registering it with the resource tracker.
+
+    Before Python 3.13 attaching registers the block as if this process had
+    created it, so it would be unlinked (or reported as leaked) when a worker
+    exits, while the publishing process still uses it.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+def _release(shm, owner):
+    try:
+        shm.close()
+    except BufferError:
+        # NumPy views of the block are still alive; the mapping is freed with them
+        pass
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedGrid:
+    """A lon/lat/z bathymetry grid in one `multiprocessing.shared_memory` block.
+
+    The publishing process creates the block once with `SharedGrid.publish`,
+    workers attach to it with `SharedGrid.attach(grid.descriptor)` and get
+    zero-copy NumPy views (read-only in workers). The publisher owns the block
+    and unlinks it on `close()`, when leaving a `with` block, when the object is
+    garbage collected, or at interpreter exit, whichever comes first.
+
+    Example:
+        with SharedGrid.publish(lon, lat, z) as grid:
+            with multiprocessing.Pool(4, initializer=attach_bathymetry,
+                                      initargs=(grid.descriptor,)) as pool:
+                subsets = pool.starmap(subset_from_singleton, boxes)
+    """
+
+    def __init__(self, shm, layout, owner):
+        self._shm = shm
+        self.layout = layout
+        self.owner = owner
+        self.arrays = {}
+        for key, (offset, shape, dtype) in layout.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            if not owner:
+                array.flags.writeable = False
+            self.arrays[key] = array
+        self._finalizer = weakref.finalize(self, _release, shm, owner)
+
+    @classmethod
+    def publish(cls, lon, lat, z):
+        """Copy lon, lat and z into a new shared memory block owned by this process."""
+        arrays = {'lon': np.ascontiguousarray(lon), 'lat': np.ascontiguousarray(lat), 'z': np.ascontiguousarray(z)}
+        if arrays['z'].shape != (arrays['lat'].size, arrays['lon'].size):
+            raise ValueError("z must have the shape (len(lat), len(lon))")
+
+        layout, size = {}, 0
+        for key, array in arrays.items():
+            layout[key] = (size, array.shape, array.dtype.str)
+            size += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        grid = cls(shm, layout, owner=True)
+        for key, array in arrays.items():
+            grid.arrays[key][...] = array
+        return grid
+
+    @classmethod
+    def publish_dataset(cls, dataset, lon_min=-180, lon_max=180, lat_min=-90, lat_max=90):
+        """Publish (a lon/lat box of) a netCDF4 or xarray bathymetry dataset, reading only that box."""
+        lon, lat = _coordinates(dataset)
+        lat_indices, lon_indices = get_subset_index_ranges(lon, lat, lon_min, lon_max, lat_min, lat_max)
+        z = _as_array(dataset.variables['z'][lat_indices, lon_indices]).astype(np.float32)
+        return cls.publish(lon[lon_indices], lat[lat_indices], z)
+
+    @classmethod
+    def attach(cls, descriptor):
+        """Attach to a grid published by another process."""
+        return cls(_attach_untracked(descriptor['name']), descriptor['layout'], owner=False)
+
+    @property
+    def descriptor(self):
+        """Small picklable description of the block, to pass to workers."""
+        return {'name': self._shm.name, 'layout': self.layout}
+
+    @property
+    def lon(self):
+        return self.arrays['lon']
+
+    @property
+    def lat(self):
+        return self.arrays['lat']
+
+    @property
+    def z(self):
+        return self.arrays['z']
+
+    def to_xarray(self):
+        """xarray Dataset whose z variable is a view of the shared block (like `xr.open_dataset`)."""
+        return xr.Dataset({'z': (('lat', 'lon'), self.z)}, coords={'lat': self.lat, 'lon': self.lon})
+
+    def close(self):
+        """Release this process' mapping and, for the publisher, destroy the block."""
+        self.arrays = {}
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def publish_bathymetry(dataset=None, lon_min=-180, lon_max=180, lat_min=-90, lat_max=90):
+    """Publish the bathymetry held by `BathymetryDataSingleton` (or `dataset`) to shared memory.
+
+    Returns:
+    - SharedGrid owned by this process; pass `grid.descriptor` to `attach_bathymetry`
+    """
+    if dataset is None:
+        dataset = BathymetryDataSingleton().get()
+    if dataset is None:
+        raise ValueError("No dataset given and none set with BathymetryDataSingleton().set()")
+    return SharedGrid.publish_dataset(dataset, lon_min, lon_max, lat_min, lat_max)
+
+def attach_bathymetry(descriptor):
+    """Pool initializer: attach to a shared grid and make it the worker's `BathymetryDataSingleton` data."""
+    grid = SharedGrid.attach(descriptor)
+    _attached_grids.append(grid)
+    BathymetryDataSingleton().set(grid.to_xarray())
+    return grid
+
+def subset_from_singleton(lon_min, lon_max, lat_min, lat_max):
+    """Worker task: lon, lat and z (copies) of a box of the singleton's bathymetry."""
+    dataset = BathymetryDataSingleton().get()
+    lon, lat = _coordinates(dataset)
+    lat_indices, lon_indices = get_subset_index_ranges(lon, lat, lon_min, lon_max, lat_min, lat_max)
+    return lon[lon_indices], lat[lat_indices], _as_array(dataset.variables['z'][lat_indices, lon_indices])
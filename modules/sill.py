@@ -0,0 +1,172 @@
+import heapq
+import numpy as np
+
+from array import array
+from collections import deque, namedtuple
+
+from .bathymetry import _as_array, _coordinates, _nearest_indices, get_subset_index_ranges
+from .hypsometry import rasterize_polygons
+
+__all__ = ['SillResult', 'find_sill', 'connection_depths']
+
+SillResult = namedtuple('SillResult', ['depth', 'lat', 'lon', 'path_lat', 'path_lon', 'path_depth'])
+SillResult.__doc__ = """Deepest connection between two points or basins.
+
+- depth: Sill depth (m, negative below sea level); the shallowest point of
+  the deepest path. A depth >= 0 means there is no connection by water.
+- lat, lon: Location of the sill
+- path_lat, path_lon, path_depth: Cells along the deepest path, from start to end
+"""
+
+_NEIGHBOURS = {
+    4: [(-1, 0), (1, 0), (0, -1), (0, 1)],
+    8: [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)],
+}
+
+
+def _priority_flood(z, sources, targets=None, connectivity=4):
+    """Minimax flood over a grid from a set of source cells.
+
+    Finds, for every reached cell, the lowest possible "highest z" over all
+    paths from any source (the level water would have to rise to), and the
+    predecessor on such a path. Cells are processed in order of that level
+    from a heap; neighbours that are not higher than the current level are
+    flooded at the same level through a plain FIFO queue, which keeps most
+    cells out of the heap. The state lives in flat `array`/`bytearray`s over a
+    grid padded with one impassable cell on every side.
+
+    Returns:
+    - level: Array (grid shape) of minimax levels, inf where not reached
+    - parent: Flat (padded) predecessor indices, -1 for sources
+    - reached: Flat (padded) index of the first target cell reached, or None
+    """
+    ny, nx = z.shape
+    width = nx + 2
+    padded = np.full((ny + 2, width), np.inf)
+    padded[1:-1, 1:-1] = np.where(np.isfinite(z), z, np.inf)
+    height = array('d', padded.ravel().tolist())
+
+    n = padded.size
+    level = array('d', [np.inf]) * n
+    parent = array('q', [-1]) * n
+    done = bytearray(n)
+    is_target = bytearray(n)
+    if targets is not None:
+        for index in np.flatnonzero(np.pad(targets, 1)):
+            is_target[index] = 1
+    offsets = [dy * width + dx for dy, dx in _NEIGHBOURS[connectivity]]
+
+    heap = []
+    for index in np.flatnonzero(np.pad(sources, 1)).tolist():
+        if height[index] < level[index]:
+            level[index] = height[index]
+            heap.append((height[index], index))
+    heapq.heapify(heap)
+    queue = deque()
+
+    reached = None
+    while queue or heap:
+        if queue:
+            index = queue.popleft()
+            current = level[index]
+        else:
+            current, index = heapq.heappop(heap)
+        if done[index]:
+            continue
+        done[index] = 1
+        if is_target[index]:
+            reached = index
+            break
+
+        for offset in offsets:
+            neighbour = index + offset
+            if done[neighbour]:
+                continue
+            neighbour_height = height[neighbour]
+            if neighbour_height == np.inf:
+                continue
+            new_level = current if neighbour_height <= current else neighbour_height
+            if new_level < level[neighbour]:
+                level[neighbour] = new_level
+                parent[neighbour] = index
+                if new_level == current:
+                    queue.append(neighbour)
+                else:
+                    heapq.heappush(heap, (new_level, neighbour))
+
+    levels = np.frombuffer(level, dtype=np.float64).reshape(ny + 2, width)[1:-1, 1:-1].copy()
+    return levels, parent, reached
+
+def _read_window(dataset, bounds):
+    lon, lat = _coordinates(dataset)
+    if bounds is None:
+        lat_indices, lon_indices = slice(0, len(lat)), slice(0, len(lon))
+    else:
+        lat_indices, lon_indices = get_subset_index_ranges(lon, lat, *bounds)
+    return lon[lon_indices], lat[lat_indices], _as_array(dataset.variables['z'][lat_indices, lon_indices])
+
+def _region_mask(region, lon, lat):
+    """Grid mask of a point (lat, lon), a polygon of (lon, lat) vertices or shapely, or a boolean mask."""
+    if isinstance(region, np.ndarray) and region.dtype == bool:
+        if region.shape != (len(lat), len(lon)):
+            raise ValueError("Mask must have the shape of the grid")
+        return region
+    mask = np.zeros((len(lat), len(lon)), dtype=bool)
+    if np.ndim(region) == 1 and len(region) == 2:
+        mask[_nearest_indices(lat, region[0]), _nearest_indices(lon, region[1])] = True
+    else:
+        mask = rasterize_polygons(lon, lat, [region]) > 0
+    if not mask.any():
+        raise ValueError("Region does not cover any grid cells")
+    return mask
+
+def find_sill(dataset, start, end, connectivity=4, bounds=None):
+    """Find the sill depth and deepest path between two points or basins.
+
+    The sill is the shallowest point on the path that stays as deep as
+    possible (a minimax path), i.e. the depth water has to rise to before the
+    two regions connect.
+
+    Parameters:
+    - dataset: netCDF4 or xarray dataset with lon, lat and z
+    - start, end: A point (lat, lon), a basin polygon of (lon, lat) vertices or
+      shapely geometry, or a boolean mask of the grid's shape
+    - connectivity: 4 (default, no diagonal steps between cells) or 8
+    - bounds: Only search inside (lon_min, lon_max, lat_min, lat_max)
+
+    Returns:
+    - SillResult namedtuple (depth, lat, lon, path_lat, path_lon, path_depth)
+    """
+    lon, lat, z = _read_window(dataset, bounds)
+    sources = _region_mask(start, lon, lat)
+    targets = _region_mask(end, lon, lat)
+
+    _, parent, reached = _priority_flood(z, sources, targets, connectivity)
+    if reached is None:
+        raise ValueError("End region cannot be reached from the start region")
+
+    # Follow the predecessors back to the start
+    path = []
+    index = reached
+    while index != -1:
+        path.append(index)
+        index = parent[index]
+    rows, cols = np.divmod(np.array(path[::-1]), len(lon) + 2)
+    rows, cols = rows - 1, cols - 1
+
+    path_depth = z[rows, cols]
+    sill = int(np.argmax(path_depth))
+    return SillResult(float(path_depth[sill]), float(lat[rows[sill]]), float(lon[cols[sill]]),
+                      lat[rows], lon[cols], path_depth)
+
+def connection_depths(dataset, start, connectivity=4, bounds=None):
+    """Sill depth between a start point/basin and every cell of the grid.
+
+    Returns:
+    - lon, lat, depth: Grid coordinates and, for every cell, the shallowest
+      depth on the deepest path from the start (NaN where unreachable)
+    """
+    lon, lat, z = _read_window(dataset, bounds)
+    levels, _, _ = _priority_flood(z, _region_mask(start, lon, lat), connectivity=connectivity)
+    levels[~np.isfinite(levels)] = np.nan
+    return lon, lat, levels
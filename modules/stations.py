@@ -0,0 +1,217 @@
+import csv
+import numpy as np
+import cartopy.crs as ccrs
+
+from scipy.spatial import cKDTree
+
+from .bathymetry import _sample_nearest
+
+__all__ = ['EARTH_RADIUS_KM', 'StationRegistry']
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _unit_vectors(lat, lon):
+    """Convert latitude/longitude in degrees to xyz coordinates on the unit sphere."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+def _km_to_chord(distance_km):
+    """Great-circle distance in km to straight-line distance on the unit sphere."""
+    return 2 * np.sin(np.minimum(np.asarray(distance_km) / EARTH_RADIUS_KM, np.pi) / 2)
+
+def _chord_to_km(chord):
+    """Straight-line distance on the unit sphere to great-circle distance in km."""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+class StationRegistry:
+    """Catalogue of named point features (moorings, CTD stations, ridge features).
+
+    Positions are indexed with a KD-tree on unit-sphere coordinates, so nearest
+    and radius queries use true great-circle distances and work across the
+    dateline and near the poles. The tree is built lazily and rebuilt only after
+    stations have been added.
+
+    Example:
+        stations = StationRegistry()
+        stations.add('DS2', 66.0128, -27.2702, kind='mooring')
+        stations.sample_depths(bathymetry_subset)
+        stations.plot(ax)
+    """
+
+    def __init__(self):
+        self._names = []
+        self._lats = []
+        self._lons = []
+        self._kinds = []
+        self._depths = []
+        self._lookup = {}
+        self._arrays = None
+        self._tree = None
+
+    @classmethod
+    def from_csv(cls, path):
+        """Create a registry from a CSV file with columns name, lat, lon and optionally kind."""
+        registry = cls()
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                registry.add(row['name'], float(row['lat']), float(row['lon']),
+                             kind=row.get('kind') or 'station')
+        return registry
+
+    def add(self, name, lat, lon, kind='station'):
+        """Add a single station. Names must be unique."""
+        if name in self._lookup:
+            raise ValueError(f"Station '{name}' is already registered")
+        self._lookup[name] = len(self._names)
+        self._names.append(name)
+        self._lats.append(float(lat))
+        self._lons.append(float(lon))
+        self._kinds.append(kind)
+        self._depths.append(np.nan)
+        self._arrays = None
+        self._tree = None
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._lookup
+
+    def __getitem__(self, name):
+        i = self._lookup[name]
+        return {'name': name, 'lat': self._lats[i], 'lon': self._lons[i],
+                'kind': self._kinds[i], 'depth': self._depths[i]}
+
+    def _build(self):
+        if self._arrays is None:
+            self._arrays = {
+                'names': np.array(self._names, dtype=object),
+                'lat': np.array(self._lats, dtype=np.float64),
+                'lon': np.array(self._lons, dtype=np.float64),
+                'kind': np.array(self._kinds, dtype=object),
+            }
+        return self._arrays
+
+    @property
+    def names(self):
+        return self._build()['names']
+
+    @property
+    def lat(self):
+        return self._build()['lat']
+
+    @property
+    def lon(self):
+        return self._build()['lon']
+
+    @property
+    def kind(self):
+        return self._build()['kind']
+
+    @property
+    def depth(self):
+        return np.array(self._depths, dtype=np.float64)
+
+    @property
+    def tree(self):
+        """KD-tree over the stations' unit-sphere coordinates."""
+        if self._tree is None:
+            if len(self) == 0:
+                raise ValueError("Station registry is empty")
+            self._tree = cKDTree(_unit_vectors(self.lat, self.lon))
+        return self._tree
+
+    def nearest(self, lat, lon, k=1):
+        """Find the k nearest stations to one or many query points.
+
+        Parameters:
+        - lat, lon: Query position(s) in degrees (scalars or arrays)
+        - k: Number of neighbours to return
+
+        Returns:
+        - distance_km, index: Same layout as `scipy.spatial.cKDTree.query`.
+          Use `registry.names[index]` to get the station names.
+        """
+        k = min(k, len(self))
+        chord, index = self.tree.query(_unit_vectors(lat, lon), k=k)
+        return _chord_to_km(chord), index
+
+    def within(self, lat, lon, radius_km):
+        """Indices of all stations within `radius_km` of a single point, sorted by distance."""
+        query = _unit_vectors(lat, lon)
+        index = np.asarray(self.tree.query_ball_point(query, _km_to_chord(radius_km)), dtype=np.intp)
+        distances = np.linalg.norm(self.tree.data[index] - query, axis=-1)
+        return index[np.argsort(distances, kind='stable')]
+
+    def pairs_within(self, radius_km):
+        """All pairs of stations (i, j with i < j) closer than `radius_km`, e.g. to find duplicates."""
+        return self.tree.query_pairs(_km_to_chord(radius_km), output_type='ndarray')
+
+    def match(self, other, radius_km):
+        """Match every station to its nearest station in another registry.
+
+        Returns:
+        - index_self, index_other, distance_km: Arrays of matched pairs; stations
+          without a partner within `radius_km` are left out.
+        """
+        chord, index_other = other.tree.query(_unit_vectors(self.lat, self.lon),
+                                              distance_upper_bound=_km_to_chord(radius_km))
+        matched = np.isfinite(chord)
+        return np.flatnonzero(matched), index_other[matched], _chord_to_km(chord[matched])
+
+    def in_region(self, lon_min, lon_max, lat_min, lat_max):
+        """Boolean mask of stations inside a lon/lat box."""
+        return ((self.lon >= lon_min) & (self.lon <= lon_max) &
+                (self.lat >= lat_min) & (self.lat <= lat_max))
+
+    def sample_depths(self, dataset, clamp=False):
+        """Look up the depth of every station from a bathymetry grid in one pass.
+
+        Uses the nearest grid cell like `get_depth_at_location` in the notebook.
+        Stations outside the grid get NaN unless `clamp` is True, in which case
+        they get the depth at the nearest edge of the grid (DS2, for example,
+        lies just north of data/bathymetry_subset.nc). The depths are stored on
+        the registry and returned.
+        """
+        depths = _sample_nearest(dataset, self.lat, self.lon, clamp)
+        self._depths = depths.tolist()
+        return depths
+
+    def plot(self, ax, region=None, kinds=None, labels=False, transform=None, **kwargs):
+        """Plot all stations in a region onto a (cartopy) axes.
+
+        Parameters:
+        - ax: Matplotlib or cartopy axes
+        - region: (lon_min, lon_max, lat_min, lat_max); defaults to the map extent
+          of a cartopy axes, or all stations for plain matplotlib axes
+        - kinds: Only plot these kinds of stations (default: all)
+        - labels: Write station names next to the markers
+        - kwargs: Passed on to `ax.scatter`, one call per kind
+
+        Returns:
+        - List of the scatter collections, one per kind (each labelled for the legend)
+        """
+        is_geo = hasattr(ax, 'projection')
+        if transform is None and is_geo:
+            transform = ccrs.PlateCarree()
+        if region is None and is_geo:
+            region = ax.get_extent(crs=ccrs.PlateCarree())
+
+        mask = np.ones(len(self), dtype=bool) if region is None else self.in_region(*region)
+        if kinds is not None:
+            mask &= np.isin(self.kind, list(kinds))
+
+        transform_kwargs = {} if transform is None else {'transform': transform}
+        collections = []
+        for kind in dict.fromkeys(self.kind[mask]):
+            selected = mask & (self.kind == kind)
+            collections.append(ax.scatter(self.lon[selected], self.lat[selected],
+                                          label=kind, **transform_kwargs, **kwargs))
+            if labels:
+                for name, x, y in zip(self.names[selected], self.lon[selected], self.lat[selected]):
+                    ax.text(x, y, f' {name}', fontsize=8, **transform_kwargs)
+        return collections
@@ -0,0 +1,102 @@
+"""
+Test the asyncio data-access layer in modules/async_access.py.
+
+Checks that concurrent identical subset requests share one read, that point
+requests are batched, and that the answers match xarray's selection.
+"""
+
+import asyncio
+import pytest
+import numpy as np
+import xarray as xr
+from pathlib import Path
+
+from modules.async_access import AsyncBathymetry
+
+DATA_FILE = Path("data/bathymetry_subset.nc")
+
+
+@pytest.fixture
+def reference():
+    if not DATA_FILE.exists():
+        pytest.skip("Bathymetry data not available")
+    with xr.open_dataset(DATA_FILE) as ds:
+        ds = ds.load()
+    # Select with float64 labels on float64 coordinates (xarray rounds labels to float32 otherwise)
+    yield ds.assign_coords(lat=ds.lat.astype('f8'), lon=ds.lon.astype('f8'))
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_concurrent_requests(reference, executor):
+    """Test single-flight subsets and batched depth requests."""
+    rng = np.random.default_rng(1)
+    lats = rng.uniform(63, 66, 300)
+    lons = rng.uniform(-35, -25, 300)
+
+    async def run():
+        async with AsyncBathymetry(DATA_FILE, max_workers=2, executor=executor) as bathymetry:
+            subsets = await asyncio.gather(*[bathymetry.subset(-30, -28, 64, 65) for _ in range(20)],
+                                           bathymetry.subset(-34, -26, 63.5, 65.5))
+            depths = await asyncio.gather(*[bathymetry.depth(lat, lon) for lat, lon in zip(lats, lons)])
+            return subsets, depths, dict(bathymetry.stats)
+
+    subsets, depths, stats = asyncio.run(run())
+
+    assert stats['subset_requests'] == 21
+    assert stats['subset_reads'] == 2, "Identical in-flight requests should share one read"
+    assert all(subset is subsets[0] for subset in subsets[:20])
+    expected_subset = reference.z.sel(lon=slice(-30, -28), lat=slice(64, 65))
+    np.testing.assert_array_equal(subsets[0].z.values, expected_subset.values)
+    np.testing.assert_array_equal(subsets[-1].lon.values, reference.lon.sel(lon=slice(-34, -26)).values)
+
+    assert stats['point_requests'] == 300
+    assert stats['point_batches'] == 1, "Points arriving together should be read in one batch"
+    expected = reference.z.sel(lat=xr.DataArray(lats), lon=xr.DataArray(lons), method='nearest').values
+    np.testing.assert_array_equal(depths, expected)
+
+
+def test_batches_are_split_by_size_and_time(reference):
+    """Test that batches are flushed at max_batch and after the batching window."""
+
+    async def run():
+        async with AsyncBathymetry(DATA_FILE, max_batch=10, batch_window=0.001) as bathymetry:
+            await asyncio.gather(*[bathymetry.depth(64.5, -30.0) for _ in range(25)])
+            first = await bathymetry.depth(65.004, -29.003)
+            second = await bathymetry.depth(64.004, -31.003)
+            return first, second, dict(bathymetry.stats)
+
+    first, second, stats = asyncio.run(run())
+    assert stats['point_batches'] == 3 + 2
+    assert first == reference.z.sel(lat=65.004, lon=-29.003, method='nearest').item()
+    assert second == reference.z.sel(lat=64.004, lon=-31.003, method='nearest').item()
+
+
+def test_points_outside_grid_are_nan(reference):
+    """Test that points outside the grid get NaN instead of the depth of the nearest edge cell."""
+
+    async def run():
+        async with AsyncBathymetry(DATA_FILE) as bathymetry:
+            single = await bathymetry.depth(0.0, 0.0)
+            batch = await bathymetry.depths([0.0, 64.504, 64.504], [0.0, -30.003, -40.0])
+            return single, batch
+
+    single, batch = asyncio.run(run())
+    assert np.isnan(single)
+    assert np.isnan(batch[0]) and np.isnan(batch[2])
+    assert batch[1] == reference.z.sel(lat=64.504, lon=-30.003, method='nearest').item()
+
+
+def test_errors_reach_every_caller():
+    """Test that a failing read raises in every waiting coroutine."""
+
+    async def run():
+        async with AsyncBathymetry("data/does_not_exist.nc") as bathymetry:
+            return await asyncio.gather(bathymetry.depth(64.5, -30.0), bathymetry.depth(65.004, -29.003),
+                                        return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, OSError) for result in results)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
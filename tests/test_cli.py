@@ -0,0 +1,139 @@
+"""
+Test the command-line batch extractor in modules/cli.py.
+
+The CLI is run through `main()` on the bathymetry subset, with a small
+worker pool.
+"""
+
+import csv
+import pytest
+import numpy as np
+import netCDF4 as nc
+from pathlib import Path
+
+from modules.bathymetry import get_bathymetry_subset_data
+from modules.cli import main, read_requests
+
+DATA_FILE = Path("data/bathymetry_subset.nc")
+
+BOXES = """name,lon_min,lon_max,lat_min,lat_max
+Irminger Sea,-35,-30,63,65
+Denmark Strait,-30,-25,65,66
+outside,10,11,0,1
+"""
+
+
+@pytest.fixture
+def data_file():
+    if not DATA_FILE.exists():
+        pytest.skip("Bathymetry data not available")
+    return str(DATA_FILE)
+
+
+def test_extract_boxes(data_file, tmp_path, capsys):
+    """Test that every box is written to its own netCDF file, identical to get_bathymetry_subset_data."""
+    boxes = tmp_path / 'boxes.csv'
+    boxes.write_text(BOXES)
+    summary = main([str(boxes), '--data', data_file, '-o', str(tmp_path / 'out'), '-j', '2', '-q'])
+    assert summary['count'] == 3
+    assert "Extracted 3 boxes" in capsys.readouterr().out
+
+    with nc.Dataset(data_file) as dataset:
+        for name, *box in read_requests(boxes)[1][:2]:
+            expected = get_bathymetry_subset_data(dataset, *box)
+            with nc.Dataset(tmp_path / 'out' / f"{name.replace(' ', '_')}.nc") as written:
+                for variable in ('lon', 'lat', 'z'):
+                    np.testing.assert_array_equal(written.variables[variable][:], expected.variables[variable][:])
+            expected.close()
+
+
+def test_dry_run_matches_bytes_read(data_file, tmp_path, capsys):
+    """Test that the dry run estimates exactly the bytes read by the extraction, without writing anything."""
+    boxes = tmp_path / 'boxes.csv'
+    boxes.write_text(BOXES)
+    estimate = main([str(boxes), '--data', data_file, '-o', str(tmp_path / 'out'), '--dry-run'])
+    assert not (tmp_path / 'out').exists()
+    assert [size for *_, size in estimate['estimates']] == [120 * 300 * 4, 60 * 300 * 4, 0]
+    assert "3 boxes" in capsys.readouterr().out
+
+    summary = main([str(boxes), '--data', data_file, '-o', str(tmp_path / 'out'), '-j', '1', '-q', '--format', 'csv'])
+    assert summary['bytes'] == estimate['bytes']
+    rows = np.loadtxt(tmp_path / 'out' / 'Denmark_Strait.csv', delimiter=',', skiprows=1)
+    assert rows.shape == (60 * 300, 3)
+
+
+def test_dry_run_does_not_download(data_file, tmp_path, monkeypatch):
+    """Test that a dry run without the ETOPO file estimates from its known grid instead of downloading it."""
+    boxes = tmp_path / 'boxes.csv'
+    boxes.write_text(BOXES)
+    with_file = main([str(boxes), '--data', data_file, '--dry-run'])
+
+    def download():
+        raise AssertionError("A dry run must not download the data")
+    monkeypatch.setattr('modules.cli.get_bathymetry_data', download)
+    monkeypatch.chdir(tmp_path)
+    without_file = main([str(boxes), '--dry-run'])
+    # The subset lies on the ETOPO grid, and the boxes lie inside the subset
+    assert without_file['estimates'][:2] == with_file['estimates'][:2]
+    assert without_file['estimates'][2][3] > 0
+
+
+def test_colliding_box_names_are_rejected(tmp_path):
+    """Test that box names that would write the same output file are rejected."""
+    boxes = tmp_path / 'boxes.csv'
+    boxes.write_text("name,lon_min,lon_max,lat_min,lat_max\na b,-35,-30,63,65\na_b,-30,-25,65,66\nc,-30,-25,65,66\n")
+    with pytest.raises(ValueError, match="'a b', 'a_b'"):
+        read_requests(boxes)
+
+    boxes.write_text("name,lon_min,lon_max,lat_min,lat_max\nIceland,-35,-30,63,65\niceland,-30,-25,65,66\n")
+    with pytest.raises(ValueError, match="same output file"):
+        read_requests(boxes)
+
+    # Point names only end up in one CSV file and may repeat
+    points = tmp_path / 'points.csv'
+    points.write_text("name,lat,lon\na,64,-30\na,65,-30\n")
+    assert len(read_requests(points)[1]) == 2
+
+
+def test_sample_points(data_file, tmp_path):
+    """Test point depths against a direct lookup, in several chunks, with NaN outside the grid."""
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(62.5, 66.5, 2500)
+    lon = rng.uniform(-36, -24, 2500)
+    points = tmp_path / 'stations.csv'
+    with open(points, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['name', 'lat', 'lon'])
+        writer.writerows(zip([f'station {i}' for i in range(len(lat))], lat, lon))
+
+    summary = main([str(points), '--data', data_file, '-o', str(tmp_path / 'out'),
+                    '-j', '2', '--chunk-size', '300', '-q'])
+    with nc.Dataset(data_file) as dataset:
+        grid_lat, grid_lon = dataset.variables['lat'][:], dataset.variables['lon'][:]
+        z = dataset.variables['z'][:]
+    rows = np.abs(grid_lat[:, None] - lat[None, :]).argmin(axis=0)
+    cols = np.abs(grid_lon[:, None] - lon[None, :]).argmin(axis=0)
+    inside = (lat > 63) & (lat < 66) & (lon > -35) & (lon < -25)
+    np.testing.assert_allclose(summary['depths'][inside], z[rows, cols][inside])
+    assert np.all(np.isnan(summary['depths'][(lat < 62.9) | (lat > 66.1) | (lon < -35.1) | (lon > -24.9)]))
+
+    with open(tmp_path / 'out' / 'stations_depths.csv', newline='') as file:
+        written = list(csv.DictReader(file))
+    assert len(written) == 2500
+    assert written[0]['name'] == 'station 0'
+
+
+def test_invalid_input(tmp_path):
+    """Test that files without box or point columns are rejected."""
+    bad = tmp_path / 'bad.csv'
+    bad.write_text("name,x,y\na,1,2\n")
+    with pytest.raises(SystemExit):
+        main([str(bad), '--dry-run'])
+
+    bad.write_text("lat,lon\n64,not a number\n")
+    with pytest.raises(ValueError, match="line 2"):
+        read_requests(bad)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
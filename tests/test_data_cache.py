@@ -0,0 +1,186 @@
+"""
+Test incremental updates of downloaded data and derived files (modules/data_cache.py).
+
+A local HTTP server stands in for the NOAA server and supports ETag and
+Last-Modified conditional requests.
+"""
+
+import threading
+import pytest
+import numpy as np
+import netCDF4 as nc
+from pathlib import Path
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules import bathymetry
+from modules.bathymetry import get_bathymetry_data, get_bathymetry_subset_data
+from modules.data_cache import DataCache, register_builder
+
+DATA_FILE = Path("data/bathymetry_subset.nc")
+
+
+class FakeDataServer:
+    """Serves files from memory and records the status of every request."""
+
+    def __init__(self):
+        self.files = {}
+        self.log = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                contents, etag, last_modified = server.files[self.path]
+                since = self.headers.get('If-Modified-Since')
+                if self.headers.get('If-None-Match') == etag or (
+                        'If-None-Match' not in self.headers and since is not None and
+                        parsedate_to_datetime(last_modified) <= parsedate_to_datetime(since)):
+                    server.log.append((self.path, 304))
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                server.log.append((self.path, 200))
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(contents)))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+                self.wfile.write(contents)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.httpd.server_port}{path}'
+
+    def publish(self, path, contents, etag, last_modified='Mon, 01 Jan 2024 00:00:00 GMT'):
+        self.files[path] = (bytes(contents), etag, last_modified)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = FakeDataServer()
+    yield server
+    server.close()
+
+
+def bathymetry_bytes(offset=0.0):
+    """Contents of the bathymetry subset file, with an optional offset added to z."""
+    with nc.Dataset(DATA_FILE) as dataset:
+        copy = get_bathymetry_subset_data(dataset, -180, 180, -90, 90)
+    copy.variables['z'][:] = copy.variables['z'][:] + offset
+    return copy.close()
+
+
+build_counts = {}
+
+@register_builder('test_depth_summary')
+def build_depth_summary(sources, output, **params):
+    build_counts[output] = build_counts.get(output, 0) + 1
+    with nc.Dataset(sources[0]) as dataset:
+        Path(output).write_text(f"{float(np.min(dataset.variables['z'][:])):.3f}\n")
+
+
+def test_refresh_only_rebuilds_dependents(server, tmp_path):
+    """Test conditional requests, content hashing and lineage-based rebuilds."""
+    if not DATA_FILE.exists():
+        pytest.skip("Bathymetry data not available")
+
+    server.publish('/etopo.nc', bathymetry_bytes(), etag='"v1"')
+    server.publish('/other.nc', bathymetry_bytes(), etag='"other-v1"')
+    etopo, other = tmp_path / 'etopo.nc', tmp_path / 'other.nc'
+    north, south = tmp_path / 'north.nc', tmp_path / 'south.nc'
+    summary, other_summary = tmp_path / 'north.txt', tmp_path / 'other.txt'
+
+    cache = DataCache(tmp_path / 'manifest.json')
+    assert cache.fetch(server.url('/etopo.nc'), etopo)
+    assert cache.fetch(server.url('/other.nc'), other)
+    cache.build(north, 'bathymetry_subset', [etopo], lon_min=-35, lon_max=-25, lat_min=65, lat_max=66)
+    cache.build(south, 'bathymetry_subset', [etopo], lon_min=-35, lon_max=-25, lat_min=63, lat_max=64)
+    cache.build(summary, 'test_depth_summary', [north])
+    cache.build(other_summary, 'test_depth_summary', [other])
+    assert cache.stale() == []
+
+    # Nothing changed: revalidation only, no downloads or rebuilds
+    server.log.clear()
+    assert DataCache(tmp_path / 'manifest.json').refresh() == {'updated_sources': [], 'rebuilt': []}
+    assert sorted(status for _, status in server.log) == [304, 304]
+
+    # New ETag but identical contents: downloaded, but nothing is rebuilt
+    server.publish('/etopo.nc', bathymetry_bytes(), etag='"v1-republished"')
+    assert DataCache(tmp_path / 'manifest.json').refresh() == {'updated_sources': [], 'rebuilt': []}
+
+    # New release of one source: only files derived from it are rebuilt, in order
+    server.publish('/etopo.nc', bathymetry_bytes(offset=-10.0), etag='"v2"')
+    build_counts.clear()
+    cache = DataCache(tmp_path / 'manifest.json')
+    result = cache.refresh()
+    assert result['updated_sources'] == [str(etopo)]
+    assert sorted(result['rebuilt']) == sorted([str(north), str(south), str(summary)])
+    assert result['rebuilt'].index(str(north)) < result['rebuilt'].index(str(summary))
+    assert build_counts == {str(summary): 1}
+
+    with nc.Dataset(north) as dataset, nc.Dataset(DATA_FILE) as original:
+        lat = original.variables['lat'][:]
+        expected = original.variables['z'][(lat >= 65) & (lat <= 66), :] - 10.0
+        np.testing.assert_allclose(dataset.variables['z'][:], expected)
+    assert cache.sources[str(etopo)]['etag'] == '"v2"'
+
+
+def test_missing_derived_file_is_rebuilt(server, tmp_path):
+    """Test that deleted derived files count as stale."""
+    if not DATA_FILE.exists():
+        pytest.skip("Bathymetry data not available")
+
+    cache = DataCache(tmp_path / 'manifest.json')
+    cache.track(DATA_FILE)
+    output = tmp_path / 'subset.nc'
+    cache.build(output, 'bathymetry_subset', [DATA_FILE], lon_min=-30, lon_max=-28, lat_min=64, lat_max=65)
+
+    output.unlink()
+    assert cache.stale() == [str(output)]
+    assert cache.rebuild_stale() == [str(output)]
+    assert output.exists()
+
+
+def test_first_refresh_without_manifest(server, tmp_path, monkeypatch):
+    """Test get_bathymetry_data(refresh=True) on a checkout that has the data file but no manifest yet."""
+    if not DATA_FILE.exists():
+        pytest.skip("Bathymetry data not available")
+
+    original_path, release, new_release = DATA_FILE.resolve(), bathymetry_bytes(), bathymetry_bytes(offset=-10.0)
+    server.publish('/etopo.nc', release, etag='"v1"')
+    monkeypatch.setattr(bathymetry, 'BATHYMETRY_DATA_URL', server.url('/etopo.nc'))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    Path(bathymetry.BATHYMETRY_DATA_PATH).write_bytes(release)
+
+    # The local file is newer than the server's copy: revalidated from its mtime, not downloaded
+    get_bathymetry_data(refresh=True).close()
+    assert server.log == [('/etopo.nc', 304)]
+    cache = DataCache()
+    assert cache.sources[bathymetry.BATHYMETRY_DATA_PATH]['url'] == server.url('/etopo.nc')
+    cache.build('data/north.nc', 'bathymetry_subset', [bathymetry.BATHYMETRY_DATA_PATH],
+                lon_min=-35, lon_max=-25, lat_min=65, lat_max=66)
+
+    get_bathymetry_data(refresh=True).close()
+    assert server.log[-1] == ('/etopo.nc', 304)
+
+    # A new release is downloaded and the derived files are rebuilt
+    server.publish('/etopo.nc', new_release, etag='"v2"', last_modified='Fri, 01 Jan 2100 00:00:00 GMT')
+    with get_bathymetry_data(refresh=True) as dataset, nc.Dataset(original_path) as original:
+        np.testing.assert_allclose(dataset.variables['z'][:], original.variables['z'][:] - 10.0)
+    assert server.log[-1] == ('/etopo.nc', 200)
+    assert DataCache().derived['data/north.nc']['sha256'] != cache.derived['data/north.nc']['sha256']
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,145 @@
+"""
+Golden-image regression tests for the exercise figures (modules/figure_regression.py).
+
+The three maps are rendered from data/bathymetry_subset.nc and compared with
+the reference images in tests/baseline/. After an intentional change to the
+figures, regenerate the references with
+
+    UPDATE_GOLDEN=1 python -m pytest tests/test_figure_regression.py
+
+Images of failed figures and difference images are written to reports/figures/.
+
+The figures come from the reference solutions in modules/figure_regression.py,
+not from the student's notebook, and their pixels depend on the library
+versions. The comparison is therefore skipped unless matplotlib, cartopy and
+FreeType match tests/baseline/versions.json, and the autograding workflow
+leaves it out.
+"""
+
+import os
+import pytest
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from pathlib import Path
+
+from modules.figure_regression import (FIGURES, REFERENCE_DIR, _box_mean, check_figures, compare_images,
+                                       hash_distance, perceptual_hash, reference_versions,
+                                       references_match_versions, rendering_versions, ssim)
+
+DATA_FILE = Path("data/bathymetry_subset.nc")
+
+
+@pytest.fixture
+def reference_image():
+    path = Path(REFERENCE_DIR) / 'ex2fig2.png'
+    if not path.exists():
+        pytest.skip("Reference images not available")
+    return plt.imread(path)
+
+
+def test_figures_match_references():
+    """Test all exercise figures against their reference images, in parallel."""
+    if not DATA_FILE.exists():
+        pytest.skip("Bathymetry data not available")
+    update = os.environ.get('UPDATE_GOLDEN') == '1'
+    if not update and not references_match_versions():
+        pytest.skip(f"References were rendered with {reference_versions()}, this is {rendering_versions()}; "
+                    "regenerate them with UPDATE_GOLDEN=1 to compare in this environment")
+
+    results = check_figures(data_path=str(DATA_FILE), output_dir='reports/figures', update=update)
+    failed = [f"{result['name']}: {result['status']} (SSIM {result.get('ssim', float('nan')):.4f}, "
+              f"hash distance {result.get('hash_distance')})" for result in results if not result['passed']]
+    assert [result['name'] for result in results] == list(FIGURES)
+    assert not failed, ("Figures differ from tests/baseline/ (see reports/figures/); if the change is "
+                        "intended, rerun with UPDATE_GOLDEN=1:\n" + "\n".join(failed))
+
+
+def test_ssim_matches_direct_computation():
+    """Test the integral-image SSIM against a loop over all windows."""
+    rng = np.random.default_rng(0)
+    x = rng.uniform(size=(20, 24))
+    y = np.clip(x + rng.normal(scale=0.1, size=x.shape), 0, 1)
+
+    values = []
+    for i in range(20 - 6):
+        for j in range(24 - 6):
+            a, b = x[i:i + 7, j:j + 7], y[i:i + 7, j:j + 7]
+            covariance = (a * b).mean() - a.mean() * b.mean()
+            values.append(((2 * a.mean() * b.mean() + 1e-4) * (2 * covariance + 9e-4)) /
+                          ((a.mean() ** 2 + b.mean() ** 2 + 1e-4) * (a.var() + b.var() + 9e-4)))
+    assert ssim(x, y) == pytest.approx(np.mean(values))
+    assert ssim(x, x) == pytest.approx(1.0)
+    np.testing.assert_allclose(_box_mean(x, 3)[0, 0], x[:3, :3].mean())
+
+
+def test_comparison_tolerates_rendering_noise(reference_image):
+    """Test that noise and a slightly different bounding box still pass."""
+    rng = np.random.default_rng(1)
+    noisy = reference_image.copy()
+    noisy[..., :3] = np.clip(noisy[..., :3] + rng.normal(scale=2 / 255, size=noisy[..., :3].shape), 0, 1)
+    assert compare_images(noisy, reference_image)['passed']
+
+    cropped = reference_image[:-2, 1:]
+    result = compare_images(cropped, reference_image)
+    assert result['passed'], result
+
+
+def test_comparison_detects_changes(reference_image):
+    """Test that changed colours, missing elements and other layouts fail."""
+    recoloured = reference_image.copy()
+    recoloured[..., :3] = recoloured[..., [2, 1, 0]]
+    assert not compare_images(recoloured, reference_image)['passed']
+
+    covered = reference_image.copy()
+    height, width = covered.shape[:2]
+    covered[height // 4:height // 2, width // 4:width // 2, :3] = 1.0
+    assert not compare_images(covered, reference_image)['passed']
+
+    assert not compare_images(reference_image[:, :width // 2], reference_image)['passed']
+    assert hash_distance(perceptual_hash(reference_image[:, ::-1]), perceptual_hash(reference_image)) > 50
+
+
+def test_failed_figure_writes_difference_images(tmp_path):
+    """Test that a figure that no longer matches fails and leaves the rendered and difference images."""
+    if not DATA_FILE.exists() or not (Path(REFERENCE_DIR) / 'ex2fig2.png').exists():
+        pytest.skip("Bathymetry data or reference images not available")
+    references = tmp_path / 'baseline'
+    references.mkdir()
+    (references / 'ex2fig1.png').write_bytes((Path(REFERENCE_DIR) / 'ex2fig2.png').read_bytes())
+
+    result, missing = check_figures(['ex2fig1', 'ex2fig3'], workers=1, data_path=str(DATA_FILE),
+                                    reference_dir=str(references), output_dir=str(tmp_path / 'out'))
+    assert result['status'] == 'failed'
+    assert missing['status'] == 'missing' and not missing['passed']
+    assert (tmp_path / 'out' / 'ex2fig1.png').exists()
+    assert (tmp_path / 'out' / 'ex2fig1-diff.png').exists()
+
+
+def test_update_records_versions(tmp_path):
+    """Test that updating the references records the library versions they were rendered with."""
+    if not DATA_FILE.exists():
+        pytest.skip("Bathymetry data not available")
+    assert reference_versions(str(tmp_path)) is None
+    assert not references_match_versions(str(tmp_path))
+    check_figures(['ex2fig1'], workers=1, data_path=str(DATA_FILE), reference_dir=str(tmp_path), update=True)
+    assert reference_versions(str(tmp_path)) == rendering_versions()
+    assert references_match_versions(str(tmp_path))
+
+
+def test_in_process_check_keeps_backend(tmp_path):
+    """Test that checking a figure in the calling process doesn't switch its matplotlib backend."""
+    if not DATA_FILE.exists():
+        pytest.skip("Bathymetry data not available")
+    backend = matplotlib.get_backend()
+    plt.switch_backend('pdf')
+    try:
+        result, = check_figures(['ex2fig1'], workers=1, data_path=str(DATA_FILE), reference_dir=str(tmp_path))
+        assert result['status'] == 'missing'
+        assert matplotlib.get_backend() == 'pdf'
+    finally:
+        plt.switch_backend(backend)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,98 @@
+"""
+Test area, volume and hypsometry calculations in modules/hypsometry.py.
+
+Results are compared with simple loops over the grid cells and with
+analytical values for synthetic grids.
+"""
+
+import pytest
+import numpy as np
+import xarray as xr
+from pathlib import Path
+
+from modules.hypsometry import (EARTH_RADIUS_M, area_at_depth, basin_volume, cell_areas,
+                                compute_hypsometry, rasterize_polygons)
+
+# Triangle in the Irminger Basin and a box with a hole around DS2
+TRIANGLE = [(-34.0, 63.2), (-28.0, 63.2), (-31.0, 65.5)]
+BOX = [(-30.0, 64.0), (-25.5, 64.0), (-25.5, 65.9), (-30.0, 65.9)]
+HOLE = [(-29.0, 64.5), (-27.0, 64.5), (-27.0, 65.5), (-29.0, 65.5)]
+
+
+@pytest.fixture
+def bathymetry_subset():
+    data_file = Path("data/bathymetry_subset.nc")
+    if not data_file.exists():
+        pytest.skip("Bathymetry data not available")
+    with xr.open_dataset(data_file) as ds:
+        yield ds.load()
+
+
+def synthetic_dataset(depth=-1000.0):
+    lon = np.arange(-179.5, 180)
+    lat = np.arange(-89.5, 90)
+    z = np.full((len(lat), len(lon)), depth)
+    return xr.Dataset({'z': (('lat', 'lon'), z)}, coords={'lat': lat, 'lon': lon})
+
+
+def test_cell_areas_cover_the_sphere():
+    """Test that the cell areas of a global grid add up to the area of the Earth."""
+    ds = synthetic_dataset()
+    areas = cell_areas(ds.lon.values, ds.lat.values)
+    np.testing.assert_allclose(areas.sum(), 4 * np.pi * EARTH_RADIUS_M ** 2, rtol=1e-12)
+    assert areas[90, 0] > areas[170, 0], "Cells shrink towards the poles"
+
+
+def test_flat_ocean_volume():
+    """Test volumes of a global ocean with a flat bottom at 1000 m."""
+    ds = synthetic_dataset(-1000.0)
+    earth_area = 4 * np.pi * EARTH_RADIUS_M ** 2
+    np.testing.assert_allclose(basin_volume(ds), 1000.0 * earth_area, rtol=1e-12)
+    np.testing.assert_allclose(basin_volume(ds, depth=-400.0), 600.0 * earth_area, rtol=1e-12)
+    np.testing.assert_allclose(area_at_depth(ds, depths=[-500.0, -1500.0]), [earth_area, 0.0], rtol=1e-12)
+
+
+def test_rasterize_polygon_with_hole(bathymetry_subset):
+    """Test rasterization against a point-by-point check of every cell."""
+    shapely = pytest.importorskip("shapely.geometry")
+    lon, lat = bathymetry_subset.lon.values, bathymetry_subset.lat.values
+    labels = rasterize_polygons(lon, lat, [TRIANGLE, shapely.Polygon(BOX, [HOLE])])
+
+    lon2d, lat2d = np.meshgrid(lon, lat)
+    in_box = (lon2d > -30) & (lon2d < -25.5) & (lat2d > 64) & (lat2d < 65.9)
+    in_hole = (lon2d > -29) & (lon2d < -27) & (lat2d > 64.5) & (lat2d < 65.5)
+    np.testing.assert_array_equal(labels == 2, in_box & ~in_hole)
+    assert (labels == 1).sum() > 0
+    assert not np.any((labels == 1) & (lat2d > 65.5))
+
+
+def test_hypsometry_matches_loop(bathymetry_subset):
+    """Test the vectorized, chunked reductions against a plain loop over cells."""
+    levels = np.array([-2500.0, -2000.0, -1000.0, -500.0, 0.0])
+    result = compute_hypsometry(bathymetry_subset, TRIANGLE, levels=levels, chunk_rows=16, workers=4)
+
+    lon, lat = bathymetry_subset.lon.values, bathymetry_subset.lat.values
+    z = bathymetry_subset.z.values.astype(np.float64)
+    mask = rasterize_polygons(lon, lat, [TRIANGLE]) > 0
+    areas = cell_areas(lon, lat)
+    expected_area = [areas[mask & (z < level)].sum() for level in levels]
+    expected_volume = [(areas * (level - z))[mask & (z < level)].sum() for level in levels]
+
+    np.testing.assert_allclose(result.area, expected_area, rtol=1e-10)
+    np.testing.assert_allclose(result.volume, expected_volume, rtol=1e-10)
+    np.testing.assert_allclose(result.total_area, areas[mask].sum(), rtol=1e-10)
+    np.testing.assert_allclose(result.total_volume, expected_volume[-1], rtol=1e-10)
+    assert np.all(np.diff(result.fraction) >= 0)
+    assert result.fraction[-1] == pytest.approx(1.0)
+
+
+def test_default_levels(bathymetry_subset):
+    """Test that default levels span the region in 100 m steps."""
+    result = compute_hypsometry(bathymetry_subset, BOX)
+    assert result.levels[-1] == 0.0
+    assert np.all(np.diff(result.levels) == 100.0)
+    assert result.area[0] == 0.0, "No seafloor is deeper than the deepest level"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
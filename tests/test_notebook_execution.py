@@ -15,8 +15,14 @@ from nbconvert.preprocessors import ExecutePreprocessor
 from pathlib import Path
 import tempfile
 import shutil
+import os
 import re
 
+from modules.notebook_report import ProfilingExecutePreprocessor, slowest_cells, write_report
+
+# Per-cell timing/memory/profile report of the notebook run (see modules/notebook_report.py)
+REPORT_PATH = Path(os.environ.get("NOTEBOOK_REPORT_DIR", "reports")) / "notebook-execution.json"
+
 
 def test_notebook_executes_without_errors():
     """Test that the assignment notebook runs completely without errors."""
@@ -47,14 +53,21 @@ def test_notebook_executes_without_errors():
         figures_dir = temp_path / "figures"
         figures_dir.mkdir(exist_ok=True)
         
-        # Execute the notebook
-        ep = ExecutePreprocessor(timeout=300, kernel_name='python3')
+        # Execute the notebook, recording time and memory per cell (not profiled, so
+        # that the timings and the timeout are those of a plain run)
+        ep = ProfilingExecutePreprocessor(timeout=300, kernel_name='python3',
+                                          submission=os.environ.get("GITHUB_REPOSITORY", ""))
         
         try:
             ep.preprocess(nb, {'metadata': {'path': str(temp_path)}})
             print("✓ Notebook executed successfully")
         except Exception as e:
-            pytest.fail(f"Notebook execution failed: {str(e)}")
+            pytest.fail(f"Notebook execution failed: {str(e)}\n"
+                        f"Slowest cells:\n  " + "\n  ".join(slowest_cells(ep.report)))
+        finally:
+            if ep.report is not None:
+                write_report(ep.report, str(REPORT_PATH))
+                print(f"Execution report written to {REPORT_PATH}")
 
 
 def test_function_works_correctly():
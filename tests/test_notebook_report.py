@@ -0,0 +1,121 @@
+"""
+Test the profiling notebook execution report in modules/notebook_report.py.
+
+Runs small synthetic notebooks, so these tests do not depend on the
+student's assignment.
+"""
+
+import json
+import time
+import pytest
+import nbformat
+from nbconvert.preprocessors import CellExecutionError
+
+from modules.notebook_report import ProfilingExecutePreprocessor, aggregate_reports, main, slowest_cells
+
+
+def make_notebook(*sources):
+    nb = nbformat.v4.new_notebook()
+    nb.cells = [nbformat.v4.new_markdown_cell("# Synthetic notebook")]
+    nb.cells += [nbformat.v4.new_code_cell(source) for source in sources]
+    return nb
+
+
+SETUP = "import time\nimport numpy as np\ndef slow_function():\n    time.sleep(0.3)"
+
+
+def test_report_per_cell(tmp_path):
+    """Test that every code cell gets timing, memory and (if slow) profile entries."""
+    nb = make_notebook(SETUP, "slow_function()", "big = np.ones(20_000_000)", "", "print('done')")
+    ep = ProfilingExecutePreprocessor(timeout=60, kernel_name='python3', slow_cell_seconds=0.2, profile=True,
+                                      submission='student-a')
+    ep.preprocess(nb, {'metadata': {'path': str(tmp_path)}})
+    report = ep.report
+
+    assert report['status'] == 'ok'
+    assert report['profiled']
+    assert report['submission'] == 'student-a'
+    assert [cell['index'] for cell in report['cells']] == [1, 2, 3, 5], "Empty and markdown cells are skipped"
+
+    slow = report['cells'][1]
+    assert slow['kernel_seconds'] >= 0.3
+    assert any(entry['function'] == 'slow_function' for entry in slow['profile'])
+    assert report['cells'][0]['profile'] == [], "Fast cells are not profiled"
+
+    allocation = report['cells'][2]
+    assert allocation['peak_rss_mb'] >= 150
+    assert report['peak_rss_mb'] == max(cell['peak_rss_mb'] for cell in report['cells'])
+
+
+def test_report_identifies_timed_out_cell(tmp_path):
+    """Test that a cell hitting the timeout is reported, including its profile."""
+    nb = make_notebook(SETUP, "while True:\n    slow_function()", "print('never runs')")
+    ep = ProfilingExecutePreprocessor(timeout=2, kernel_name='python3', slow_cell_seconds=0.5, profile=True)
+    with pytest.raises(CellExecutionError):
+        ep.preprocess(nb, {'metadata': {'path': str(tmp_path)}})
+    report = ep.report
+
+    assert report['status'] == 'timeout'
+    assert len(report['cells']) == 2
+    timed_out = report['cells'][-1]
+    assert timed_out['status'] == 'timeout'
+    assert timed_out['wall_seconds'] >= 2
+    assert any(entry['function'] == 'slow_function' for entry in timed_out['profile'])
+    assert slowest_cells(report, n=1)[0].startswith("cell 2 (timeout")
+
+
+def test_timings_are_not_profiled_by_default(tmp_path):
+    """Test that graded runs time the cells without cProfile and say so in the report."""
+    nb = make_notebook(SETUP, "slow_function()")
+    ep = ProfilingExecutePreprocessor(timeout=60, kernel_name='python3', slow_cell_seconds=0.2)
+    ep.preprocess(nb, {'metadata': {'path': str(tmp_path)}})
+
+    assert ep.report['profiled'] is False
+    assert ep.report['cells'][1]['kernel_seconds'] >= 0.3
+    assert ep.report['cells'][1]['profile'] == []
+
+
+def test_timeout_when_interrupt_is_swallowed(tmp_path):
+    """Test that a cell ignoring KeyboardInterrupt still ends at the timeout instead of hanging."""
+    swallow = "while True:\n    try:\n        time.sleep(0.1)\n    except:\n        pass"
+    nb = make_notebook(SETUP, swallow, "print('never runs')")
+    ep = ProfilingExecutePreprocessor(timeout=3, kernel_name='python3', interrupt_grace_seconds=1)
+    started = time.perf_counter()
+    with pytest.raises(CellExecutionError):
+        ep.preprocess(nb, {'metadata': {'path': str(tmp_path)}})
+    assert time.perf_counter() - started < 30
+    assert ep.report['status'] == 'timeout'
+    assert ep.report['cells'][-1]['status'] == 'timeout'
+    assert "timed out" in ep.report['error']
+
+
+def test_aggregate_reports(tmp_path):
+    """Test the batch view over several submissions."""
+    def report(name, seconds, status='ok'):
+        return {'submission': name, 'status': status, 'total_seconds': sum(seconds),
+                'cells': [{'index': i, 'source': f'cell {i}', 'status': 'ok', 'wall_seconds': s,
+                           'peak_rss_mb': 200.0 + s} for i, s in enumerate(seconds)]}
+
+    reports = [report('a', [1.0, 2.0]), report('b', [1.0, 40.0]), report('c', [1.0, 3.0], status='error')]
+    aggregate = aggregate_reports(reports)
+
+    assert aggregate['submissions'] == 3
+    assert aggregate['status'] == {'ok': 2, 'error': 1}
+    assert aggregate['cells'][0]['index'] == 1, "Cells are sorted by their 95th percentile time"
+    assert aggregate['cells'][0]['slowest_submission'] == 'b'
+    assert aggregate['cells'][0]['max_peak_rss_mb'] == 240.0
+    assert aggregate['suggested_timeout_seconds'] >= 2 * 37
+    assert aggregate['profiled_submissions'] == 0
+    assert aggregate_reports([dict(reports[0], profiled=True)])['profiled_submissions'] == 1
+
+    paths = []
+    for r in reports:
+        path = tmp_path / f"{r['submission']}.json"
+        path.write_text(json.dumps(r))
+        paths.append(str(path))
+    main(paths + ['-o', str(tmp_path / 'aggregate.json')])
+    assert json.loads((tmp_path / 'aggregate.json').read_text())['submissions'] == 3
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,41 @@
+"""
+Test the names exported by `from modules import *`.
+
+Every module re-exported in modules/__init__.py lists its public API in
+`__all__`, so that imports such as matplotlib's Path don't leak into (and
+shadow names in) the caller's namespace.
+"""
+
+import pytest
+import pathlib
+
+import modules
+
+MODULES = ['stations', 'regrid', 'async_access', 'data_cache', 'shared_grid', 'hypsometry', 'sill', 'plotting']
+
+
+@pytest.mark.parametrize('name', MODULES)
+def test_modules_define_public_api(name):
+    """Test that __all__ only lists public names that the module defines."""
+    module = getattr(modules, name)
+    assert module.__all__
+    for public in module.__all__:
+        value = getattr(module, public)
+        assert not public.startswith('_')
+        if callable(value):
+            assert value.__module__ == module.__name__, public
+
+
+def test_star_import_does_not_leak_imports():
+    """Test that star-importing the package doesn't shadow pathlib.Path or export helper imports."""
+    namespace = {'Path': pathlib.Path}
+    exec('from modules import *', namespace)
+    assert namespace['Path'] is pathlib.Path
+    for leaked in ('array', 'heapq', 'deque', 'namedtuple', 'sparse', 'contourpy', 'ccrs', 'cKDTree',
+                   'ThreadPoolExecutor', 'LineCollection', 'shared_memory', 'json', 'hashlib'):
+        assert leaked not in namespace, leaked
+    assert 'Regridder' in namespace and 'find_sill' in namespace
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,151 @@
+"""
+Test decimation of contour and scatter overlays in modules/plotting.py.
+
+Decimated figures are rendered next to the full-resolution matplotlib
+versions and compared pixel by pixel.
+"""
+
+import io
+import pytest
+import numpy as np
+import xarray as xr
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from pathlib import Path
+from scipy import ndimage
+
+from modules.plotting import decimate_points, decimated_contour, decimated_scatter, simplify_lines
+
+
+@pytest.fixture
+def fine_grid():
+    data_file = Path("data/bathymetry_subset.nc")
+    if not data_file.exists():
+        pytest.skip("Bathymetry data not available")
+    with xr.open_dataset(data_file) as ds:
+        # Interpolate to a finer grid, so that most vertices are closer than a pixel
+        z = ndimage.zoom(ds.z.values.astype(np.float64), 3, order=1)
+    return np.linspace(-35, -25, z.shape[1]), np.linspace(63, 66, z.shape[0]), z
+
+
+def render(draw, figsize=(16 / 2.54, 10 / 2.54), dpi=150):
+    fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
+    ax.set_xlim(-35, -25)
+    ax.set_ylim(63, 66)
+    draw(ax)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi)
+    plt.close(fig)
+    buffer.seek(0)
+    return plt.imread(buffer)
+
+
+def distance_to_polyline(points, line):
+    """Distance of every point to the nearest segment of a polyline."""
+    a, b = line[:-1], line[1:]
+    direction = b - a
+    length_squared = np.maximum((direction ** 2).sum(axis=1), 1e-300)
+    t = np.clip(((points[:, None, :] - a) * direction).sum(axis=2) / length_squared, 0, 1)
+    nearest = a + t[..., None] * direction
+    return np.hypot(*(points[:, None, :] - nearest).transpose(2, 0, 1)).min(axis=1)
+
+
+def test_simplify_lines_within_tolerance():
+    """Test that simplified lines keep their end points and stay within the tolerance."""
+    rng = np.random.default_rng(0)
+    lines = [np.cumsum(rng.normal(scale=0.3, size=(n, 2)), axis=0) for n in (1, 2, 10, 400, 2000)]
+    for tolerance in (0.5, 2.0):
+        for line, keep in zip(lines, simplify_lines(lines, tolerance)):
+            assert keep[0] == 0 and keep[-1] == len(line) - 1
+            assert np.all(np.diff(keep) > 0)
+            if len(keep) > 1:
+                assert distance_to_polyline(line, line[keep]).max() <= tolerance + 1e-9
+    assert sum(map(len, simplify_lines(lines, 2.0))) < sum(map(len, lines)) / 3
+
+    # A straight, densely sampled line collapses to its end points
+    straight = np.column_stack([np.linspace(0, 100, 1000), np.linspace(0, 50, 1000)])
+    assert list(simplify_lines([straight])[0]) == [0, 999]
+
+
+def test_decimated_contour_looks_the_same(fine_grid):
+    """Test that decimated isobaths have far fewer vertices and render the same image as ax.contour."""
+    lon, lat, z = fine_grid
+    levels = np.arange(-3000, 1, 250)
+    full, decimated = {}, {}
+
+    def draw_full(ax):
+        # Negative levels are dashed by default
+        contours = ax.contour(lon, lat, z, levels, colors='k', linewidths=0.5)
+        full['vertices'] = sum(len(path.vertices) for path in contours.get_paths())
+
+    def draw_decimated(ax):
+        collection = decimated_contour(ax, lon, lat, z, levels, colors='k', linewidths=0.5)
+        decimated['vertices'] = sum(len(segment) for segment in collection.get_segments())
+
+    difference = np.abs(render(draw_full) - render(draw_decimated))[..., :3].max(axis=-1)
+    assert decimated['vertices'] < full['vertices'] / 3
+    assert np.mean(difference > 0.25) < 1e-3
+
+
+def test_decimated_contour_colours_by_level(fine_grid):
+    """Test that lines are coloured by their level when no colors are given."""
+    lon, lat, z = fine_grid
+    fig, ax = plt.subplots()
+    ax.set_xlim(-35, -25)
+    ax.set_ylim(63, 66)
+    collection = decimated_contour(ax, lon, lat, z, [-2000, -1000], cmap='viridis')
+    assert set(collection.get_array()) == {-2000, -1000}
+    assert collection.get_clim() == (-2000, -1000)
+    assert {dashes for _, dashes in collection.get_linestyles()} == {None}, "Coloured levels are not dashed"
+
+    # In one colour, negative levels are cut into dashes unless a linestyle is given
+    dashed = decimated_contour(ax, lon, lat, z, [-1000], colors='k')
+    solid = decimated_contour(ax, lon, lat, z, [-1000], colors='k', linestyles='solid')
+    assert len(dashed.get_segments()) > 10 * len(solid.get_segments())
+    plt.close(fig)
+
+
+def test_decimate_points_one_per_pixel():
+    """Test that at most one point is kept per pixel and points outside the axes are dropped."""
+    rng = np.random.default_rng(1)
+    lon = rng.uniform(-36, -24, 200_000)
+    lat = rng.uniform(62.5, 66.5, 200_000)
+    depth = rng.uniform(-3000, 0, 200_000)
+
+    fig, ax = plt.subplots(figsize=(4, 2), dpi=50)
+    ax.set_xlim(-35, -25)
+    ax.set_ylim(63, 66)
+    keep = decimate_points(ax, lon, lat, dpi=100)
+    assert np.all((lon[keep] >= -35) & (lon[keep] <= -25) & (lat[keep] >= 63) & (lat[keep] <= 66))
+    pixels = np.floor(ax.transData.transform(np.column_stack([lon[keep], lat[keep]])) * 2)
+    assert len(np.unique(pixels, axis=0)) == len(keep)
+    assert len(keep) <= ax.bbox.width * ax.bbox.height * 4 * 1.1
+
+    scatter = decimated_scatter(ax, lon, lat, c=depth, s=1, dpi=100)
+    np.testing.assert_array_equal(scatter.get_array(), depth[keep])
+    plt.close(fig)
+
+
+def test_decimated_scatter_looks_the_same():
+    """Test that a dense scatter overlay renders the same after decimation, in one colour and coloured by depth."""
+    rng = np.random.default_rng(2)
+    lon = rng.normal(-30, 1.5, 100_000)
+    lat = rng.normal(64.5, 0.5, 100_000)
+    draw_full = lambda ax: ax.scatter(lon, lat, s=4, c='k', marker='s', linewidths=0)
+    draw_decimated = lambda ax: decimated_scatter(ax, lon, lat, s=4, c='k', marker='s', linewidths=0, dpi=150)
+
+    difference = np.abs(render(draw_full) - render(draw_decimated))[..., :3].max(axis=-1)
+    assert np.mean(difference > 0.5) < 0.01
+
+    # Matplotlib draws later points on top, so the last point of every pixel has to be kept
+    depth = rng.uniform(-3000, 0, lon.size)
+    draw_full = lambda ax: ax.scatter(lon, lat, s=4, c=depth, marker='s', linewidths=0, vmin=-3000, vmax=0)
+    draw_decimated = lambda ax: decimated_scatter(ax, lon, lat, s=4, c=depth, marker='s', linewidths=0,
+                                                  vmin=-3000, vmax=0, dpi=150)
+    difference = np.abs(render(draw_full) - render(draw_decimated))[..., :3].max(axis=-1)
+    assert np.mean(difference > 0.25) < 0.01
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,126 @@
+"""
+Test regridding of the bathymetry subset with modules/regrid.py.
+
+Each method is compared with an independent xarray computation on target
+grids that line up with the source grid.
+"""
+
+import pytest
+import numpy as np
+import xarray as xr
+from pathlib import Path
+
+from modules.regrid import REGRID_METHODS, Regridder, regrid_bathymetry, get_regridder
+
+
+@pytest.fixture
+def bathymetry_subset():
+    data_file = Path("data/bathymetry_subset.nc")
+    if not data_file.exists():
+        pytest.skip("Bathymetry data not available")
+    with xr.open_dataset(data_file) as ds:
+        yield ds.load()
+
+
+def coarse_grid(ds, factor=5):
+    """Target grid whose cells each contain exactly factor x factor source cells."""
+    return (ds.lon.values.reshape(-1, factor).mean(axis=1),
+            ds.lat.values.reshape(-1, factor).mean(axis=1))
+
+
+def test_conservative_matches_area_weighted_mean(bathymetry_subset):
+    """Test that conservative regridding is the cos(lat)-weighted block mean."""
+    target_lon, target_lat = coarse_grid(bathymetry_subset)
+    result = regrid_bathymetry(bathymetry_subset, target_lon, target_lat)
+
+    weights = np.cos(np.radians(bathymetry_subset.lat)) * xr.ones_like(bathymetry_subset.z)
+    expected = ((bathymetry_subset.z * weights).coarsen(lat=5, lon=5).sum() /
+                weights.coarsen(lat=5, lon=5).sum())
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result.values, expected.values, atol=0.05)
+
+
+@pytest.mark.parametrize("method", ["min", "max"])
+def test_min_max_match_block_reduction(bathymetry_subset, method):
+    """Test that min/max regridding picks the extreme source cell per target cell."""
+    target_lon, target_lat = coarse_grid(bathymetry_subset)
+    result = regrid_bathymetry(bathymetry_subset, target_lon, target_lat, method=method)
+    expected = getattr(bathymetry_subset.z.coarsen(lat=5, lon=5), method)()
+    np.testing.assert_array_equal(result.values, expected.values)
+
+
+def test_bilinear_matches_xarray_interp(bathymetry_subset):
+    """Test bilinear regridding against xarray's linear interpolation."""
+    target_lon = np.linspace(-34.5, -25.5, 37)
+    target_lat = np.linspace(63.5, 65.5, 23)
+    result = regrid_bathymetry(bathymetry_subset, target_lon, target_lat, method='bilinear')
+    expected = bathymetry_subset.z.interp(lat=target_lat, lon=target_lon)
+    np.testing.assert_allclose(result.values, expected.values, atol=0.01)
+
+
+def test_curvilinear_target(bathymetry_subset):
+    """Test regridding onto a rotated, stretched curvilinear grid."""
+    x, y = np.meshgrid(np.linspace(-33, -27, 40), np.linspace(63.5, 65.5, 30))
+    target_lon = x + 0.2 * (y - 64.5)
+    target_lat = y + 0.1 * (x + 30)
+
+    conservative = regrid_bathymetry(bathymetry_subset, target_lon, target_lat)
+    bilinear = regrid_bathymetry(bathymetry_subset, target_lon, target_lat, method='bilinear')
+    deepest = regrid_bathymetry(bathymetry_subset, target_lon, target_lat, method='min')
+
+    assert conservative.dims == ('y', 'x')
+    assert conservative.shape == (30, 40)
+    assert not np.isnan(conservative.values).any(), "Every target cell lies inside the source grid"
+    assert np.all(deepest.values <= conservative.values)
+    # Cell means and point values agree on average
+    assert abs(float(conservative.mean()) - float(bilinear.mean())) < 20
+
+
+def test_weights_are_reused_and_chunked(bathymetry_subset):
+    """Test that regridders are cached and that chunked application gives the same answer."""
+    target_lon, target_lat = coarse_grid(bathymetry_subset)
+    lon, lat = bathymetry_subset.lon.values, bathymetry_subset.lat.values
+    assert get_regridder(lon, lat, target_lon, target_lat) is get_regridder(lon, lat, target_lon, target_lat)
+
+    single = Regridder(lon, lat, target_lon, target_lat)
+    chunked = Regridder(lon, lat, target_lon, target_lat, chunk_size=100)
+    z = bathymetry_subset.z.values[single.source_window]
+    np.testing.assert_array_equal(single(z, workers=1), chunked(z, workers=4))
+
+    with pytest.raises(ValueError):
+        single(z[:-1])
+
+
+def test_nan_cells_are_ignored():
+    """Test that missing source values don't spread into the regridded field."""
+    lon = np.arange(0.5, 10)
+    lat = np.arange(0.5, 10)
+    z = -np.ones((10, 10))
+    z[:5, :5] = np.nan
+    regridder = Regridder(lon, lat, [2.5, 7.5], [2.5, 7.5])
+    result = regridder(z[regridder.source_window])
+    assert np.isnan(result[0, 0])
+    np.testing.assert_allclose(result[1], -1.0)
+
+
+@pytest.mark.parametrize('method', REGRID_METHODS)
+def test_descending_target_axes(method):
+    """Test that descending target axes give the flipped result of ascending ones."""
+    lon = np.arange(0.5, 10)
+    lat = np.arange(0.5, 10)
+    z = -np.add.outer(lat, 10 * lon)
+    ascending = Regridder(lon, lat, [2.5, 7.5], [2.5, 7.5], method=method)
+    expected = ascending(z[ascending.source_window])
+    assert np.all(np.isfinite(expected))
+    for target_lon, target_lat, flipped in (([2.5, 7.5], [7.5, 2.5], expected[::-1]),
+                                            ([7.5, 2.5], [2.5, 7.5], expected[:, ::-1]),
+                                            ([7.5, 2.5], [7.5, 2.5], expected[::-1, ::-1])):
+        regridder = Regridder(lon, lat, target_lon, target_lat, method=method)
+        np.testing.assert_allclose(regridder(z[regridder.source_window]), flipped)
+
+    with pytest.raises(ValueError, match="ascending or descending"):
+        Regridder(lon, lat, [2.5, 7.5, 5.0], [2.5, 7.5], method=method)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
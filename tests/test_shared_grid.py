@@ -0,0 +1,82 @@
+"""
+Test the shared-memory grid handoff in modules/shared_grid.py.
+
+A grid is published once and read by a pool of worker processes through the
+BathymetryDataSingleton, without each worker loading its own copy.
+"""
+
+import multiprocessing
+import pytest
+import numpy as np
+import netCDF4 as nc
+import xarray as xr
+from pathlib import Path
+
+from modules.bathymetry import BathymetryDataSingleton, get_bathymetry_subset_data
+from modules.shared_grid import SharedGrid, attach_bathymetry, publish_bathymetry, subset_from_singleton
+
+DATA_FILE = Path("data/bathymetry_subset.nc")
+
+
+@pytest.fixture
+def dataset():
+    if not DATA_FILE.exists():
+        pytest.skip("Bathymetry data not available")
+    with nc.Dataset(DATA_FILE) as dataset:
+        yield dataset
+
+
+def test_workers_read_shared_grid(dataset):
+    """Test that pool workers see the published grid through the singleton."""
+    boxes = [(-30, -28, 64, 65), (-35, -25, 63, 66), (-27.5, -27, 65.5, 66)]
+    with publish_bathymetry(dataset) as grid:
+        with multiprocessing.Pool(2, initializer=attach_bathymetry, initargs=(grid.descriptor,)) as pool:
+            results = pool.starmap(subset_from_singleton, boxes)
+
+    for box, (lon, lat, z) in zip(boxes, results):
+        expected = get_bathymetry_subset_data(dataset, *box)
+        np.testing.assert_array_equal(lon, expected.variables['lon'][:])
+        np.testing.assert_array_equal(lat, expected.variables['lat'][:])
+        np.testing.assert_array_equal(z, expected.variables['z'][:])
+        expected.close()
+
+
+def test_attached_views_are_zero_copy(dataset):
+    """Test that attached arrays are read-only views of the publisher's memory."""
+    with SharedGrid.publish_dataset(dataset, -30, -28, 64, 65) as grid:
+        attached = SharedGrid.attach(grid.descriptor)
+
+        grid.z[0, 0] = 123.0
+        assert attached.z[0, 0] == 123.0, "Attached grid should see writes of the publisher"
+        assert not attached.z.flags.writeable
+        assert not attached.z.flags.owndata
+
+        ds = attached.to_xarray()
+        assert isinstance(ds, xr.Dataset)
+        assert ds.z.values[0, 0] == 123.0
+        # The helpers of the bathymetry module accept the shared dataset as well
+        subset = get_bathymetry_subset_data(ds, -29.5, -28.5, 64.2, 64.8)
+        assert subset.variables['z'].shape[0] > 0
+        subset.close()
+
+        del ds
+        attached.close()
+
+    with pytest.raises(FileNotFoundError):
+        SharedGrid.attach(grid.descriptor)
+
+
+def test_publish_from_singleton(dataset):
+    """Test publishing the dataset held by the singleton."""
+    singleton = BathymetryDataSingleton()
+    previous = singleton.get()
+    singleton.set(dataset)
+    try:
+        with publish_bathymetry(lon_min=-30, lon_max=-28, lat_min=64, lat_max=65) as grid:
+            assert grid.z.shape == (60, 120)
+    finally:
+        singleton.set(previous)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,143 @@
+"""
+Test sill depths and deepest paths in modules/sill.py.
+
+The flood is compared with a threshold search on synthetic grids and on the
+bathymetry subset: the sill depth is the lowest level at which the two
+regions lie in the same connected component of {z <= level}.
+"""
+
+import pytest
+import numpy as np
+import xarray as xr
+from pathlib import Path
+from scipy import ndimage
+
+from modules.sill import connection_depths, find_sill
+
+
+@pytest.fixture
+def bathymetry_subset():
+    data_file = Path("data/bathymetry_subset.nc")
+    if not data_file.exists():
+        pytest.skip("Bathymetry data not available")
+    with xr.open_dataset(data_file) as ds:
+        yield ds.load()
+
+
+def make_dataset(z):
+    lat = np.linspace(60.0, 61.0, z.shape[0])
+    lon = np.linspace(-30.0, -28.0, z.shape[1])
+    return xr.Dataset({'z': (('lat', 'lon'), z)}, coords={'lat': lat, 'lon': lon})
+
+
+def threshold_sill(z, start, end):
+    """Reference: bisection over the grid values with connected-component labelling.
+
+    start and end are (row, col) cells or boolean masks of the grid.
+    """
+    masks = []
+    for region in (start, end):
+        if isinstance(region, tuple):
+            mask = np.zeros(z.shape, dtype=bool)
+            mask[region] = True
+            region = mask
+        masks.append(region)
+    levels = np.unique(z[np.isfinite(z)])
+    low, high = 0, len(levels) - 1
+    while low < high:
+        middle = (low + high) // 2
+        labels, _ = ndimage.label(z <= levels[middle])
+        common = np.intersect1d(labels[masks[0]], labels[masks[1]])
+        if np.any(common > 0):
+            high = middle
+        else:
+            low = middle + 1
+    return levels[low]
+
+
+def test_two_basins_with_ridge():
+    """Test the sill of a ridge with one deep gap between two basins."""
+    z = np.full((21, 41), -3000.0)
+    z[:, 20] = -500.0
+    z[15, 20] = -1200.0
+    ds = make_dataset(z)
+
+    result = find_sill(ds, (float(ds.lat[5]), float(ds.lon[2])), (float(ds.lat[5]), float(ds.lon[38])))
+    assert result.depth == -1200.0
+    assert result.lat == float(ds.lat[15])
+    assert result.lon == float(ds.lon[20])
+    assert result.path_depth.max() == result.depth
+    assert (result.path_lat[0], result.path_lon[0]) == (float(ds.lat[5]), float(ds.lon[2]))
+    assert (result.path_lat[-1], result.path_lon[-1]) == (float(ds.lat[5]), float(ds.lon[38]))
+
+    # Consecutive path cells are neighbours
+    rows = np.searchsorted(ds.lat.values, result.path_lat)
+    cols = np.searchsorted(ds.lon.values, result.path_lon)
+    assert np.all(np.abs(np.diff(rows)) + np.abs(np.diff(cols)) == 1)
+
+
+def test_connectivity_and_missing_values():
+    """Test diagonal gaps with 8-connectivity, and that NaN cells are impassable."""
+    z = np.full((10, 10), -2000.0)
+    z[np.arange(10), np.arange(10)[::-1]] = -100.0
+    z[4, 5] = -1500.0
+    z[5, 4] = -1500.0
+    ds = make_dataset(z)
+    start, end = (float(ds.lat[0]), float(ds.lon[0])), (float(ds.lat[9]), float(ds.lon[9]))
+
+    assert find_sill(ds, start, end).depth == -1500.0
+    assert find_sill(ds, start, end, connectivity=8).depth == -2000.0
+
+    z[4, 5] = np.nan
+    z[5, 4] = np.nan
+    assert find_sill(make_dataset(z), start, end).depth == -100.0
+
+    z[np.arange(10), np.arange(10)[::-1]] = np.nan
+    with pytest.raises(ValueError):
+        find_sill(make_dataset(z), start, end)
+
+
+def test_random_grids_match_threshold_search():
+    """Test sill depths on random smooth grids against the threshold search."""
+    rng = np.random.default_rng(42)
+    for _ in range(5):
+        z = ndimage.gaussian_filter(rng.normal(size=(60, 80)), 3) * 1000 - 1000
+        ds = make_dataset(z)
+        start, end = (10, 5), (50, 70)
+        result = find_sill(ds, (float(ds.lat[start[0]]), float(ds.lon[start[1]])),
+                           (float(ds.lat[end[0]]), float(ds.lon[end[1]])))
+        assert result.depth == threshold_sill(z, start, end)
+
+        lon, lat, depths = connection_depths(ds, (float(ds.lat[start[0]]), float(ds.lon[start[1]])))
+        assert depths[end] == result.depth
+        assert np.all(depths >= z)
+
+
+def test_basins_as_polygons_and_masks(bathymetry_subset):
+    """Test basins given as polygons and masks on the bathymetry subset."""
+    ds = bathymetry_subset
+    z = ds.z.values.astype(np.float64)
+    irminger = [(-34.5, 63.1), (-31.0, 63.1), (-31.0, 64.0), (-34.5, 64.0)]
+    iceland_basin_mask = np.zeros(z.shape, dtype=bool)
+    iceland_basin_mask[-20:, -20:] = True
+
+    result = find_sill(ds, irminger, iceland_basin_mask)
+    lat, lon = ds.lat.values, ds.lon.values
+    in_irminger = ((lon[None, :] >= -34.5) & (lon[None, :] <= -31.0) &
+                   (lat[:, None] >= 63.1) & (lat[:, None] <= 64.0))
+    assert result.depth == threshold_sill(z, in_irminger, iceland_basin_mask)
+    assert -34.5 <= result.path_lon[0] <= -31.0
+    assert iceland_basin_mask[np.searchsorted(lat, result.path_lat[-1]), np.searchsorted(lon, result.path_lon[-1])]
+
+
+def test_bounds_restrict_the_search(bathymetry_subset):
+    """Test that bounds limit the grid that is read and searched."""
+    ds = bathymetry_subset
+    result = find_sill(ds, (64.0, -33.0), (65.0, -30.0), bounds=(-34, -29, 63.5, 65.5))
+    assert np.all((result.path_lon >= -34) & (result.path_lon <= -29))
+    assert np.all((result.path_lat >= 63.5) & (result.path_lat <= 65.5))
+    assert result.depth >= find_sill(ds, (64.0, -33.0), (65.0, -30.0)).depth
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,136 @@
+"""
+Test the station registry in modules/stations.py.
+
+Checks nearest-neighbour and radius queries against brute-force great-circle
+distances and the bulk depth lookup against the xarray reference lookup.
+"""
+
+import pytest
+import numpy as np
+import xarray as xr
+import netCDF4 as nc
+import matplotlib.pyplot as plt
+from pathlib import Path
+
+from modules.stations import StationRegistry, EARTH_RADIUS_KM
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Reference great-circle distance."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def random_registry(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    registry = StationRegistry()
+    lats = rng.uniform(55, 75, n)
+    lons = rng.uniform(-45, -5, n)
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        registry.add(f'CTD{i:04d}', lat, lon, kind='ctd')
+    return registry
+
+
+def test_nearest_matches_brute_force():
+    """Test that k-nearest queries agree with brute-force haversine distances."""
+    registry = random_registry()
+    query_lat, query_lon = 66.0128, -27.2702
+
+    distances, index = registry.nearest(query_lat, query_lon, k=5)
+
+    reference = haversine_km(query_lat, query_lon, registry.lat, registry.lon)
+    expected = np.argsort(reference)[:5]
+    np.testing.assert_array_equal(index, expected)
+    np.testing.assert_allclose(distances, reference[expected], rtol=1e-9)
+
+
+def test_within_radius_and_pairs():
+    """Test radius queries and duplicate detection."""
+    registry = random_registry()
+    reference = haversine_km(66.0, -27.0, registry.lat, registry.lon)
+
+    index = registry.within(66.0, -27.0, 50.0)
+    assert set(index) == set(np.flatnonzero(reference <= 50.0))
+    assert np.all(np.diff(reference[index]) >= 0), "Results should be sorted by distance"
+
+    registry.add('DS2', 66.0128, -27.2702, kind='mooring')
+    registry.add('DS2-duplicate', 66.0129, -27.2703, kind='mooring')
+    pairs = registry.pairs_within(0.1)
+    assert [list(pair) for pair in pairs] == [[len(registry) - 2, len(registry) - 1]]
+
+
+def test_match_registries():
+    """Test matching stations of one catalogue to another."""
+    moorings = StationRegistry()
+    moorings.add('DS2', 66.0128, -27.2702, kind='mooring')
+    moorings.add('Far away', 10.0, 10.0, kind='mooring')
+
+    ctd = StationRegistry()
+    ctd.add('CTD-near-DS2', 66.02, -27.28)
+    ctd.add('CTD-other', 64.0, -30.0)
+
+    index_moorings, index_ctd, distance = moorings.match(ctd, radius_km=5.0)
+    assert list(index_moorings) == [0]
+    assert list(ctd.names[index_ctd]) == ['CTD-near-DS2']
+    assert distance[0] < 2.0
+
+
+def test_duplicate_names_rejected():
+    """Test that station names must be unique."""
+    registry = StationRegistry()
+    registry.add('DS2', 66.0128, -27.2702)
+    with pytest.raises(ValueError):
+        registry.add('DS2', 0.0, 0.0)
+
+
+def test_sample_depths_matches_reference():
+    """Test bulk depth lookup against xarray's nearest-neighbour selection."""
+    data_file = Path("data/bathymetry_subset.nc")
+    if not data_file.exists():
+        pytest.skip("Bathymetry data not available")
+
+    registry = random_registry(500)
+    registry.add('DS2', 66.0128, -27.2702, kind='mooring')
+
+    with xr.open_dataset(data_file) as bathymetry_subset:
+        depths = registry.sample_depths(bathymetry_subset)
+        inside = registry.in_region(-35, -25, 63, 66)
+        expected = bathymetry_subset.z.sel(
+            lat=xr.DataArray(registry.lat[inside]),
+            lon=xr.DataArray(registry.lon[inside]),
+            method='nearest',
+        ).values
+
+    np.testing.assert_allclose(depths[inside], expected)
+    assert np.all(np.isnan(depths[~registry.in_region(-35.1, -24.9, 62.9, 66.1)])), \
+        "Stations outside the grid should have no depth"
+    assert np.isnan(registry['DS2']['depth']), "DS2 lies just north of the subset grid"
+
+    # With clamping, DS2 gets the depth at the northern edge like `.sel(method='nearest')`
+    with xr.open_dataset(data_file) as bathymetry_subset:
+        clamped = registry.sample_depths(bathymetry_subset, clamp=True)
+        expected_ds2 = bathymetry_subset.z.sel(lat=66.0128, lon=-27.2702, method='nearest').item()
+    assert clamped[-1] == expected_ds2 < 0
+
+    # The netCDF4 interface gives the same answer
+    with nc.Dataset(data_file) as dataset:
+        np.testing.assert_allclose(registry.sample_depths(dataset)[inside], expected)
+
+
+def test_plot_stations_in_region():
+    """Test that stations are plotted with one labelled collection per kind."""
+    registry = random_registry(200)
+    registry.add('Mooring in region', 65.5, -27.5, kind='mooring')
+
+    fig, ax = plt.subplots()
+    collections = registry.plot(ax, region=(-35, -25, 63, 66), s=10)
+    labels = [collection.get_label() for collection in collections]
+    assert sorted(labels) == ['ctd', 'mooring']
+    n_plotted = sum(len(collection.get_offsets()) for collection in collections)
+    assert n_plotted == registry.in_region(-35, -25, 63, 66).sum()
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])